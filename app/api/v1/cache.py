@@ -0,0 +1,225 @@
+import gzip
+import hashlib
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, FrozenSet, Hashable, Iterable, Optional, Set, Tuple
+from urllib.parse import urlencode
+from fastapi import APIRouter, Request, Response
+from app.api.v1.responses import ORJSONResponse
+from fastapi.routing import APIRoute
+from app.cache_tags import current_tags
+from app.config import settings
+from app.db.database import replicas
+from app.api.v1.pagination import NEXT_CURSOR_HEADER
+from app.api.v1.streaming import wants_ndjson
+
+
+
+CACHE_STATUS_HEADER = "X-Cache"
+
+# заголовки ответа, которые сохраняются вместе с телом
+_STORED_HEADERS = ("content-type", NEXT_CURSOR_HEADER.lower())
+
+# примерная цена одной метки в памяти (кортеж, число, место в множествах) — входит в размер записи
+TAG_BYTES = 120
+
+
+@dataclass
+class CachedResponse:
+    body: bytes
+    gzipped: Optional[bytes]
+    etag: str
+    headers: Dict[str, str]
+    expires_at: float
+    tags: FrozenSet[Hashable] = frozenset()
+
+    @property
+    def size(self) -> int:
+        return len(self.body) + len(self.gzipped or b"") + len(self.tags) * TAG_BYTES
+
+
+class ResponseCache:
+    # Готовые тела ответов в памяти: TTL, вытеснение давно не использованных (LRU),
+    # ограничение на суммарный размер и вытеснение по меткам изменившихся данных
+    def __init__(self, max_bytes: int, ttl_seconds: float, gzip_min_bytes: int):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.gzip_min_bytes = gzip_min_bytes
+        self._entries: "OrderedDict[Tuple, CachedResponse]" = OrderedDict()
+        self._bytes = 0
+        # метка -> ключи записей, в которых она есть
+        self._tagged: Dict[Hashable, Set[Tuple]] = {}
+        # растёт при каждом вытеснении по изменению данных (см. CachedRoute)
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key: Tuple) -> Optional[CachedResponse]:
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at <= time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(
+        self,
+        key: Tuple,
+        body: bytes,
+        headers: Dict[str, str],
+        tags: Iterable[Hashable] = (),
+    ) -> CachedResponse:
+        # gzip считается один раз при записи, а не на каждый ответ
+        gzipped = gzip.compress(body, compresslevel=6) if len(body) >= self.gzip_min_bytes else None
+        entry = CachedResponse(
+            body=body,
+            gzipped=gzipped,
+            etag='"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"',
+            headers=headers,
+            expires_at=time.monotonic() + self.ttl_seconds,
+            tags=frozenset(tags),
+        )
+        if entry.size > self.max_bytes:
+            return entry
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = entry
+        self._bytes += entry.size
+        for tag in entry.tags:
+            self._tagged.setdefault(tag, set()).add(key)
+        while self._bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+        return entry
+
+    def _remove(self, key: Tuple):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+        for tag in entry.tags:
+            keys = self._tagged[tag]
+            keys.discard(key)
+            if not keys:
+                del self._tagged[tag]
+
+    def evict(self, tags: Iterable[Hashable]) -> int:
+        # записи, в которых есть хотя бы одна из меток
+        self.generation += 1
+        keys = set()
+        for tag in tags:
+            keys.update(self._tagged.get(tag, ()))
+        for key in keys:
+            self._remove(key)
+        self.invalidations += len(keys)
+        return len(keys)
+
+    def clear(self):
+        self.generation += 1
+        self._entries.clear()
+        self._tagged.clear()
+        self._bytes = 0
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+
+response_cache = ResponseCache(
+    max_bytes=settings.cache.max_bytes,
+    ttl_seconds=settings.cache.ttl_seconds,
+    gzip_min_bytes=settings.cache.gzip_min_bytes,
+)
+
+
+def cache_key(request: Request) -> Tuple:
+    # порядок параметров в запросе не важен; ключ API входит в ключ только хэшем.
+    # Запись в кэше появляется лишь после ответа, прошедшего проверку ключа,
+    # поэтому попадание с чужим ключом невозможно
+    query = urlencode(sorted(request.query_params.multi_items()))
+    api_key = hashlib.sha256(request.headers.get("x-api-key", "").encode()).hexdigest()
+    return request.url.path, query, api_key
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    # для If-None-Match сравнение слабое: префикс W/ и суффикс сжатой версии не учитываются
+    candidates = (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+    return any(tag in (etag, etag[:-1] + '-gzip"') for tag in candidates)
+
+
+def _cached_response(request: Request, entry: CachedResponse, status: str) -> Response:
+    headers = {**entry.headers, "Vary": "Accept-Encoding", CACHE_STATUS_HEADER: status}
+    body, etag = entry.body, entry.etag
+    if entry.gzipped is not None and "gzip" in request.headers.get("accept-encoding", ""):
+        # у сжатого представления свой сильный ETag
+        body, etag = entry.gzipped, entry.etag[:-1] + '-gzip"'
+        headers["Content-Encoding"] = "gzip"
+    headers["ETag"] = etag
+    if _etag_matches(request.headers.get("if-none-match", ""), entry.etag):
+        headers.pop("content-type", None)
+        headers.pop("Content-Encoding", None)
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, headers=headers)
+
+
+class CachedRoute(APIRoute):
+    # Кэширует успешные GET-ответы эндпоинта целиком, вместе с заголовком курсора
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+        if "GET" not in self.methods:
+            return handler
+
+        async def cached_handler(request: Request) -> Response:
+            # NDJSON стримится и не кэшируется
+            if not settings.cache.enabled or wants_ndjson(request):
+                return await handler(request)
+            key = cache_key(request)
+            entry = response_cache.get(key)
+            if entry is not None:
+                return _cached_response(request, entry, "HIT")
+            generation = response_cache.generation
+            tags = set()
+            token = current_tags.set(tags)
+            try:
+                response = await handler(request)
+            finally:
+                current_tags.reset(token)
+            body = getattr(response, "body", None)
+            if response.status_code != 200 or body is None:
+                return response
+            # Пока ответ готовился, данные менялись — он мог собраться из старых. Реплики, ещё
+            # не применившие изменение, отдают старые данные: такой ответ жил бы в кэше весь TTL
+            if response_cache.generation != generation or not replicas.caught_up():
+                return response
+            headers = {
+                name: value for name, value in response.headers.items()
+                if name in _STORED_HEADERS
+            }
+            return _cached_response(request, response_cache.put(key, body, headers, tags), "MISS")
+
+        return cached_handler
+
+
+router = APIRouter()
+
+
+@router.get("/stats", summary="Статистика кэша ответов")
+async def cache_stats():
+    return ORJSONResponse(response_cache.stats())
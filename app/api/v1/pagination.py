@@ -0,0 +1,54 @@
+import base64
+import binascii
+import orjson
+from typing import Optional, Tuple
+from fastapi import HTTPException, Query
+from app.api.v1.responses import ORJSONResponse
+
+
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(key: list) -> str:
+    return base64.urlsafe_b64encode(orjson.dumps(key)).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: str) -> list:
+    try:
+        key = orjson.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (binascii.Error, ValueError):
+        key = None
+    if (
+        not isinstance(key, list)
+        or not key
+        or not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in key)
+    ):
+        raise HTTPException(status_code=400, detail="Некорректный курсор")
+    return key
+
+
+class PageParams:
+    def __init__(
+        self,
+        limit: int = Query(50, ge=1, le=200),
+        cursor: Optional[str] = Query(
+            None,
+            description=f"Курсор следующей страницы из заголовка {NEXT_CURSOR_HEADER} предыдущего ответа",
+        ),
+    ):
+        self.limit = limit
+        self.after = decode_cursor(cursor) if cursor else None
+
+    def key(self, size: int) -> Optional[list]:
+        # курсор, выданный другим эндпоинтом, не подходит по форме ключа
+        if self.after is not None and len(self.after) != size:
+            raise HTTPException(status_code=400, detail="Некорректный курсор")
+        return self.after
+
+
+def paginate(page: Tuple[list, Optional[list]]) -> ORJSONResponse:
+    # готовый ответ: FastAPI не валидирует его повторно по response_model
+    items, next_key = page
+    headers = {NEXT_CURSOR_HEADER: encode_cursor(next_key)} if next_key is not None else None
+    return ORJSONResponse(items, headers=headers)
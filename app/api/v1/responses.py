@@ -0,0 +1,11 @@
+from typing import Any
+from fastapi.responses import ORJSONResponse as BaseORJSONResponse
+from app.metrics import measure_serialization
+
+
+
+class ORJSONResponse(BaseORJSONResponse):
+    # время сериализации попадает в метрики запроса и Server-Timing
+    def render(self, content: Any) -> bytes:
+        with measure_serialization():
+            return super().render(content)
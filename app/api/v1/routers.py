@@ -1,43 +1,106 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from app.api.v1.responses import ORJSONResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
-from app.db.database import get_db
+from app.db.database import get_read_db
+from app.dependencies.timeouts import route_statement_timeout
 from app.schemas import schemas
 from app.db.crud import organization as org_crud
+from app.models import models
+from app.api.v1.cache import CachedRoute
+from app.cache_tags import NAME, add_tags
+from app.api.v1.pagination import PageParams, paginate
+from app.api.v1.streaming import NDJSON_RESPONSES, ndjson_response, wants_ndjson
+from app.indexes.autocomplete import autocomplete_index
 
 
 
-router = APIRouter()
+router = APIRouter(route_class=CachedRoute, dependencies=[Depends(route_statement_timeout)])
+
+
+def card_shape(
+    fields: Optional[str] = Query(
+        None,
+        description="Поля карточки через запятую: " + ",".join(org_crud.CARD_FIELDS) + ". По умолчанию — все",
+    ),
+    expand: Optional[str] = Query(
+        None,
+        description="Связанные данные в дополнение к fields (или к id,name, если fields не задан): building,phones,activities",
+    ),
+    depth: int = Query(3, ge=1, le=10, description="Сколько уровней видов деятельности раскрывать в ответе"),
+) -> org_crud.CardShape:
+    if fields is None and expand is None:
+        return org_crud.CardShape(depth=depth)
+    requested = {"id"}
+    requested.update(f.strip() for f in (fields or "id,name").split(",") if f.strip())
+    requested.update(f.strip() for f in (expand or "").split(",") if f.strip())
+    unknown = requested - set(org_crud.CARD_FIELDS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Неизвестные поля: {', '.join(sorted(unknown))}")
+    return org_crud.CardShape(fields=frozenset(requested), depth=depth)
 
 
 @router.get("/building/{building_id}", 
             response_model=List[schemas.OrganizationOut],
+            responses=NDJSON_RESPONSES,
             summary="Список всех организаций находящихся в конкретном здании")
-async def get_orgs_by_building(building_id: int, db: AsyncSession = Depends(get_db)):
-    return await org_crud.get_by_building(db, building_id)
+async def get_orgs_by_building(
+    building_id: int,
+    request: Request,
+    page: PageParams = Depends(),
+    shape: org_crud.CardShape = Depends(card_shape),
+    db: AsyncSession = Depends(get_read_db)
+):
+    if wants_ndjson(request):
+        return ndjson_response(org_crud.stream_organizations(org_crud.building_orgs(building_id), shape))
+    return paginate(await org_crud.get_by_building(db, building_id, page.limit, shape, page.key(1)))
 
 
 @router.get("/by-activity", 
             response_model=List[schemas.OrganizationOut],
+            responses=NDJSON_RESPONSES,
             summary="Список организаций, относящихся к указанному виду деятельности и всем его подвидам")
-async def get_orgs_by_activity(name: str, db: AsyncSession = Depends(get_db)):
-    activity = await org_crud.get_activity_by_name(db, name)
+async def get_orgs_by_activity(
+    name: str,
+    request: Request,
+    page: PageParams = Depends(),
+    shape: org_crud.CardShape = Depends(card_shape),
+    db: AsyncSession = Depends(get_read_db)
+):
+    activity = await org_crud.get_activity_by_name(name)
     if not activity:
         raise HTTPException(status_code=404, detail="Вид деятельности не найден")
-    return await org_crud.get_by_activity_only(db, activity.id)
+    if wants_ndjson(request):
+        return ndjson_response(org_crud.stream_organizations(org_crud.activity_orgs(activity.id), shape))
+    return paginate(await org_crud.get_by_activity_only(db, activity.id, page.limit, shape, page.key(1)))
 
 
 @router.get("/search-by-name", 
             response_model=List[schemas.OrganizationOut],
+            responses=NDJSON_RESPONSES,
             summary="Поиск организации по названию")
-async def search_orgs_by_name(name: str, db: AsyncSession = Depends(get_db)):
-    return await org_crud.search_by_name(db, name)
+async def search_orgs_by_name(
+    request: Request,
+    name: str = Query(..., min_length=1),
+    page: PageParams = Depends(),
+    shape: org_crud.CardShape = Depends(card_shape),
+    db: AsyncSession = Depends(get_read_db)
+):
+    if wants_ndjson(request):
+        return ndjson_response(org_crud.stream_organizations(
+            org_crud.name_orgs(name),
+            shape,
+            order_by=[org_crud.name_rank(name).desc(), models.Organization.id],
+        ))
+    return paginate(await org_crud.search_by_name(db, name, page.limit, shape, page.key(2)))
 
 
 @router.get("/geo-search", 
             response_model=List[schemas.OrganizationOut],
+            responses=NDJSON_RESPONSES,
             summary="Список организаций, которые находятся в заданном радиусе/прямоугольной области относительно указанной точки на карте. список зданий")
 async def geo_search_orgs(
+    request: Request,
     lat: Optional[float] = None,
     lon: Optional[float] = None,
     radius_km: Optional[float] = None,
@@ -45,32 +108,183 @@ async def geo_search_orgs(
     lat_max: Optional[float] = None,
     lon_min: Optional[float] = None,
     lon_max: Optional[float] = None,
-    db: AsyncSession = Depends(get_db)
+    page: PageParams = Depends(),
+    shape: org_crud.CardShape = Depends(card_shape),
+    db: AsyncSession = Depends(get_read_db)
 ):
     if radius_km and lat is not None and lon is not None:
-        return await org_crud.get_by_radius(db, lat, lon, radius_km)
+        if wants_ndjson(request):
+            return ndjson_response(org_crud.stream_organizations(org_crud.radius_orgs(lat, lon, radius_km), shape))
+        return paginate(await org_crud.get_by_radius(
+            db, lat, lon, radius_km, page.limit, shape, page.key(1)
+        ))
     elif all(v is not None for v in [lat_min, lat_max, lon_min, lon_max]):
-        return await org_crud.get_by_rectangle(db, lat_min, lat_max, lon_min, lon_max)
+        if wants_ndjson(request):
+            return ndjson_response(org_crud.stream_organizations(
+                org_crud.rectangle_orgs(lat_min, lat_max, lon_min, lon_max), shape
+            ))
+        return paginate(await org_crud.get_by_rectangle(
+            db, lat_min, lat_max, lon_min, lon_max, page.limit, shape, page.key(1)
+        ))
     else:
         raise HTTPException(status_code=400, detail="Укажите либо радиус (lat, lon, radius_km), либо прямоугольник (lat_min, lat_max, lon_min, lon_max)")
 
 
+@router.get("/geo-nearest",
+            response_model=List[schemas.OrganizationNearOut],
+            summary="Ближайшие к указанной точке организации, отсортированные по расстоянию")
+async def geo_nearest_orgs(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    k: int = Query(20, ge=1, le=100),
+    shape: org_crud.CardShape = Depends(card_shape),
+    db: AsyncSession = Depends(get_read_db)
+):
+    return ORJSONResponse(await org_crud.get_nearest(db, lat, lon, k, shape))
+
+
+@router.get("/geo-clusters",
+            response_model=List[schemas.GeoClusterOut],
+            summary="Количество организаций и их центр по ячейкам geohash в прямоугольной области")
+async def geo_cluster_orgs(
+    lat_min: float,
+    lat_max: float,
+    lon_min: float,
+    lon_max: float,
+    precision: int = Query(5, ge=1, le=12),
+    db: AsyncSession = Depends(get_read_db)
+):
+    return ORJSONResponse(await org_crud.get_clusters(db, lat_min, lat_max, lon_min, lon_max, precision))
+
+
 @router.get("/search-activity", 
             response_model=List[schemas.OrganizationOut],
+            responses=NDJSON_RESPONSES,
             summary="Поиск организаций по виду деятельности (с учётом вложенных подкатегорий)")
-async def search_orgs_by_activity_name(name: str, db: AsyncSession = Depends(get_db)):
-    activity = await org_crud.get_activity_by_name(db, name)
+async def search_orgs_by_activity_name(
+    name: str,
+    request: Request,
+    page: PageParams = Depends(),
+    shape: org_crud.CardShape = Depends(card_shape),
+    db: AsyncSession = Depends(get_read_db)
+):
+    activity = await org_crud.get_activity_by_name(name)
     if not activity:
         raise HTTPException(status_code=404, detail="Вид деятельности не найден")
 
-    return await org_crud.get_by_activity_tree(db, activity.id)
+    if wants_ndjson(request):
+        return ndjson_response(org_crud.stream_organizations(org_crud.activity_tree_orgs(activity.id), shape))
+    return paginate(await org_crud.get_by_activity_tree(db, activity.id, page.limit, shape, page.key(1)))
+
+
+@router.get("/by-activities",
+            response_model=List[schemas.OrganizationOut],
+            summary="Организации, у которых есть любой (any_of) или каждый (all_of) из указанных видов деятельности с учётом подвидов")
+async def get_orgs_by_activities(
+    any_of: List[str] = Query([]),
+    all_of: List[str] = Query([]),
+    page: PageParams = Depends(),
+    shape: org_crud.CardShape = Depends(card_shape),
+    db: AsyncSession = Depends(get_read_db)
+):
+    if not any_of and not all_of:
+        raise HTTPException(status_code=400, detail="Укажите any_of или all_of")
+    activity_ids = {}
+    for name in {*any_of, *all_of}:
+        activity = await org_crud.get_activity_by_name(name)
+        if not activity:
+            raise HTTPException(status_code=404, detail=f"Вид деятельности не найден: {name}")
+        activity_ids[name] = activity.id
+    return paginate(await org_crud.get_by_activities(
+        db,
+        [activity_ids[name] for name in any_of],
+        [activity_ids[name] for name in all_of],
+        page.limit,
+        shape,
+        page.key(1),
+    ))
+
+
+@router.get("/search",
+            response_model=List[schemas.OrganizationOut],
+            responses=NDJSON_RESPONSES,
+            summary="Поиск организаций по любому сочетанию фильтров: название, вид деятельности, здание, радиус или прямоугольник")
+async def search_orgs(
+    request: Request,
+    name: Optional[str] = Query(None, min_length=1),
+    activity: Optional[str] = Query(None, description="Вид деятельности с учётом вложенных подкатегорий"),
+    building_id: Optional[int] = None,
+    lat: Optional[float] = None,
+    lon: Optional[float] = None,
+    radius_km: Optional[float] = None,
+    lat_min: Optional[float] = None,
+    lat_max: Optional[float] = None,
+    lon_min: Optional[float] = None,
+    lon_max: Optional[float] = None,
+    page: PageParams = Depends(),
+    shape: org_crud.CardShape = Depends(card_shape),
+    db: AsyncSession = Depends(get_read_db)
+):
+    filters = {}
+    if name is not None:
+        filters["name"] = name
+    if activity is not None:
+        found = await org_crud.get_activity_by_name(activity)
+        if not found:
+            raise HTTPException(status_code=404, detail="Вид деятельности не найден")
+        filters["activity_id"] = found.id
+    if building_id is not None:
+        filters["building_id"] = building_id
+    if radius_km and lat is not None and lon is not None:
+        filters["radius"] = (lat, lon, radius_km)
+    if all(v is not None for v in [lat_min, lat_max, lon_min, lon_max]):
+        filters["rectangle"] = (lat_min, lat_max, lon_min, lon_max)
+    if not filters:
+        raise HTTPException(status_code=400, detail="Укажите хотя бы один фильтр")
+
+    if wants_ndjson(request):
+        order_by = [org_crud.name_rank(name).desc(), models.Organization.id] if name is not None else None
+        return ndjson_response(org_crud.stream_organizations(org_crud.combined_orgs(**filters), shape, order_by=order_by))
+    key_size = 2 if name is not None else 1
+    return paginate(await org_crud.search_combined(db, page.limit, shape, page.key(key_size), **filters))
+
+
+@router.get("/autocomplete",
+            response_model=List[schemas.SuggestionOut],
+            summary="Подсказки названий организаций и видов деятельности по префиксу")
+async def autocomplete(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(10, ge=1, le=50),
+):
+    await org_crud.ensure_index_loaded(autocomplete_index)
+    add_tags([NAME])
+    return ORJSONResponse([
+        {"kind": kind, "id": item_id, "name": name}
+        for kind, item_id, name in autocomplete_index.suggest(q, limit)
+    ])
+
+
+@router.post("/batch",
+             response_model=schemas.OrganizationBatchOut,
+             summary="Информация о нескольких организациях по списку идентификаторов")
+async def get_orgs_batch(
+    body: schemas.OrganizationBatchIn,
+    shape: org_crud.CardShape = Depends(card_shape),
+    db: AsyncSession = Depends(get_read_db)
+):
+    items, missing = await org_crud.get_by_ids(db, body.ids, shape)
+    return ORJSONResponse({"items": items, "missing": missing})
 
 
 @router.get("/{org_id}", 
             response_model=schemas.OrganizationOut,
             summary="Вывод информации об организации по её идентификатору")
-async def get_org_by_id(org_id: int, db: AsyncSession = Depends(get_db)):
-    org = await org_crud.get_by_id(db, org_id)
+async def get_org_by_id(
+    org_id: int,
+    shape: org_crud.CardShape = Depends(card_shape),
+    db: AsyncSession = Depends(get_read_db)
+):
+    org = await org_crud.get_by_id(db, org_id, shape)
     if not org:
         raise HTTPException(status_code=404, detail="Организация не найдена")
-    return org
+    return ORJSONResponse(org)
@@ -0,0 +1,32 @@
+import orjson
+from typing import AsyncIterator, List
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+from app.metrics import count_rows, measure_serialization
+
+
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+# описание альтернативного формата ответа для OpenAPI
+NDJSON_RESPONSES = {
+    200: {
+        "content": {NDJSON_MEDIA_TYPE: {}},
+        "description": f"При Accept: {NDJSON_MEDIA_TYPE} — весь результат построчно, без пагинации",
+    },
+}
+
+
+def wants_ndjson(request: Request) -> bool:
+    return NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+def ndjson_response(batches: AsyncIterator[List[dict]]) -> StreamingResponse:
+    async def body():
+        async for batch in batches:
+            # строки серверного курсора не видны в rowcount — считаем их здесь
+            count_rows(len(batch))
+            with measure_serialization():
+                chunk = b"".join(orjson.dumps(item) + b"\n" for item in batch)
+            yield chunk
+    return StreamingResponse(body(), media_type=NDJSON_MEDIA_TYPE)
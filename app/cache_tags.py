@@ -0,0 +1,18 @@
+from contextvars import ContextVar
+from typing import Hashable, Iterable, Optional, Set
+
+
+# Метки данных, из которых собран ответ: ("organization", id), ("building", id), ("activity", id)
+# и метки выборок, состав которых нельзя вывести из id (геопоиск, поиск по названию).
+# Кэш ответов по ним вытесняет только записи, затронутые изменением
+GEO = ("geo",)
+NAME = ("name",)
+
+# метки текущего кэшируемого запроса; вне его — None, и ничего не собирается
+current_tags: ContextVar[Optional[Set[Hashable]]] = ContextVar("current_tags", default=None)
+
+
+def add_tags(tags: Iterable[Hashable]):
+    collected = current_tags.get()
+    if collected is not None:
+        collected.update(tags)
@@ -0,0 +1,284 @@
+"""Массовый импорт зданий, видов деятельности, организаций и их связей.
+
+Файлы читаются потоком (CSV с заголовком или NDJSON), пачками по --batch-size
+строк уходят через COPY во временные таблицы, затем одним набором SQL-запросов
+проверяются ссылки и выполняется upsert в рабочие таблицы. Всё — в одной транзакции.
+
+    python -m app.commands.import_data --buildings buildings.csv --activities activities.csv \\
+        --organizations organizations.ndjson --phones phones.csv --organization-activities links.csv
+"""
+import argparse
+import asyncio
+import csv
+import json
+from itertools import islice
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import orjson
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+from sqlalchemy.schema import CreateIndex, DropIndex
+
+from app.db.database import engine
+from app.invalidation import CHANNEL
+from app.models import models
+
+
+def _optional_int(value) -> Optional[int]:
+    return None if value in (None, "") else int(value)
+
+
+# колонки входных файлов и их типы; COPY в бинарном формате требует точных типов Python
+SOURCES: Dict[str, List[Tuple[str, str, Callable]]] = {
+    "buildings": [
+        ("id", "integer", int),
+        ("address", "text", str),
+        ("latitude", "float8", float),
+        ("longitude", "float8", float),
+    ],
+    "activities": [("id", "integer", int), ("name", "text", str), ("parent_id", "integer", _optional_int)],
+    "organizations": [("id", "integer", int), ("name", "text", str), ("building_id", "integer", int)],
+    "phones": [("organization_id", "integer", int), ("phone_number", "text", str)],
+    "organization_activities": [("organization_id", "integer", int), ("activity_id", "integer", int)],
+}
+
+# пользовательские триггеры на время импорта отключаются: замыкание пересобирается целиком,
+# а вместо уведомления на каждую строку уходит одно — о полной перезагрузке
+TRIGGER_TABLES = ("activities", "buildings", "organizations", "organization_phones", "organization_activities")
+
+# индексы, которые дешевле построить заново, чем обновлять на каждой вставке (--rebuild-search-indexes)
+BULK_INDEXES = ("ix_organizations_name_trgm", "ix_buildings_earth")
+
+
+def read_records(path: Path, columns: List[Tuple[str, str, Callable]]) -> Iterator[tuple]:
+    with path.open(encoding="utf-8", newline="") as source:
+        if path.suffix in (".ndjson", ".jsonl"):
+            rows = (orjson.loads(line) for line in source if line.strip())
+        else:
+            rows = csv.DictReader(source)
+        for row in rows:
+            yield tuple(convert(row.get(name)) for name, _, convert in columns)
+
+
+async def copy_to_staging(conn: AsyncConnection, source: str, path: Path, batch_size: int) -> int:
+    columns = SOURCES[source]
+    table = f"import_{source}"
+    # seq — порядок строк во входе: при повторе ключа побеждает последняя
+    await conn.execute(text(
+        f"CREATE TEMP TABLE {table} (seq bigint GENERATED ALWAYS AS IDENTITY, "
+        + ", ".join(f"{name} {sql_type}" for name, sql_type, _ in columns)
+        + ") ON COMMIT DROP"
+    ))
+    driver = (await conn.get_raw_connection()).driver_connection
+    records = read_records(path, columns)
+    loaded = 0
+    # в памяти не больше одной пачки, каким бы большим ни был файл
+    while batch := list(islice(records, batch_size)):
+        await driver.copy_records_to_table(table, records=batch, columns=[name for name, _, _ in columns])
+        loaded += len(batch)
+    return loaded
+
+
+async def reject(conn: AsyncConnection, sql: str) -> int:
+    # удалённые строки считает сервер — клиенту уходит одно число, а не строка на каждую
+    return (await conn.execute(
+        text(f"WITH rejected AS ({sql} RETURNING 1) SELECT count(*) FROM rejected")
+    )).scalar()
+
+
+async def merge_activities(conn: AsyncConnection) -> dict:
+    # родитель должен быть в файле или уже в БД; отброшенная строка тянет за собой своё поддерево,
+    # поэтому удаляем, пока есть что удалять — по одному запросу на уровень
+    rejected = 0
+    while removed := await reject(conn, """
+        DELETE FROM import_activities s
+        WHERE s.parent_id IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM import_activities p WHERE p.id = s.parent_id)
+          AND NOT EXISTS (SELECT 1 FROM activities p WHERE p.id = s.parent_id)
+    """):
+        rejected += removed
+    upserted = (await conn.execute(text("""
+        INSERT INTO activities (id, name, parent_id)
+        SELECT DISTINCT ON (id) id, name, parent_id FROM import_activities ORDER BY id, seq DESC
+        ON CONFLICT (id) DO UPDATE SET name = EXCLUDED.name, parent_id = EXCLUDED.parent_id
+    """))).rowcount
+    # рекурсивная пересборка замыкания зациклится на кольце — проверяем, что всё достижимо от корней
+    unreachable = (await conn.execute(text("""
+        WITH RECURSIVE reachable AS (
+            SELECT id FROM activities WHERE parent_id IS NULL
+            UNION
+            SELECT a.id FROM activities a JOIN reachable r ON a.parent_id = r.id
+        )
+        SELECT array_agg(id ORDER BY id) FROM activities WHERE id NOT IN (SELECT id FROM reachable)
+    """))).scalar()
+    if unreachable:
+        raise SystemExit(f"Циклические ссылки parent_id у видов деятельности: {unreachable[:20]}")
+    return {"upserted": upserted, "rejected": rejected}
+
+
+async def merge_buildings(conn: AsyncConnection) -> dict:
+    # geohash — вычисляемая колонка и считается самой вставкой
+    upserted = (await conn.execute(text("""
+        INSERT INTO buildings (id, address, latitude, longitude)
+        SELECT DISTINCT ON (id) id, address, latitude, longitude FROM import_buildings ORDER BY id, seq DESC
+        ON CONFLICT (id) DO UPDATE SET
+            address = EXCLUDED.address, latitude = EXCLUDED.latitude, longitude = EXCLUDED.longitude
+    """))).rowcount
+    return {"upserted": upserted, "rejected": 0}
+
+
+async def merge_organizations(conn: AsyncConnection) -> dict:
+    # здания к этому моменту уже загружены, поэтому достаточно проверить рабочую таблицу
+    rejected = await reject(conn, """
+        DELETE FROM import_organizations s
+        WHERE NOT EXISTS (SELECT 1 FROM buildings b WHERE b.id = s.building_id)
+    """)
+    upserted = (await conn.execute(text("""
+        INSERT INTO organizations (id, name, building_id)
+        SELECT DISTINCT ON (id) id, name, building_id FROM import_organizations ORDER BY id, seq DESC
+        ON CONFLICT (id) DO UPDATE SET name = EXCLUDED.name, building_id = EXCLUDED.building_id
+    """))).rowcount
+    return {"upserted": upserted, "rejected": rejected}
+
+
+async def merge_phones(conn: AsyncConnection) -> dict:
+    # у организаций из файла набор телефонов заменяется целиком
+    rejected = await reject(conn, """
+        DELETE FROM import_phones s
+        WHERE NOT EXISTS (SELECT 1 FROM organizations o WHERE o.id = s.organization_id)
+    """)
+    await conn.execute(text("""
+        DELETE FROM organization_phones p
+        USING (SELECT DISTINCT organization_id FROM import_phones) s
+        WHERE p.organization_id = s.organization_id
+    """))
+    upserted = (await conn.execute(text("""
+        INSERT INTO organization_phones (organization_id, phone_number)
+        SELECT organization_id, phone_number FROM import_phones ORDER BY organization_id, seq
+    """))).rowcount
+    return {"upserted": upserted, "rejected": rejected}
+
+
+async def merge_organization_activities(conn: AsyncConnection) -> dict:
+    # так же, как телефоны: набор видов деятельности организации заменяется целиком
+    rejected = await reject(conn, """
+        DELETE FROM import_organization_activities s
+        WHERE NOT EXISTS (SELECT 1 FROM organizations o WHERE o.id = s.organization_id)
+           OR NOT EXISTS (SELECT 1 FROM activities a WHERE a.id = s.activity_id)
+    """)
+    await conn.execute(text("""
+        DELETE FROM organization_activities oa
+        USING (SELECT DISTINCT organization_id FROM import_organization_activities) s
+        WHERE oa.organization_id = s.organization_id
+    """))
+    upserted = (await conn.execute(text("""
+        INSERT INTO organization_activities (organization_id, activity_id)
+        SELECT organization_id, activity_id FROM import_organization_activities
+        GROUP BY organization_id, activity_id
+        ORDER BY organization_id, min(seq)
+    """))).rowcount
+    return {"upserted": upserted, "rejected": rejected}
+
+
+# порядок важен: ссылки проверяются по уже загруженным таблицам
+MERGES = {
+    "activities": merge_activities,
+    "buildings": merge_buildings,
+    "organizations": merge_organizations,
+    "phones": merge_phones,
+    "organization_activities": merge_organization_activities,
+}
+
+
+def bulk_indexes() -> list:
+    indexes = [index for table in models.Base.metadata.tables.values() for index in table.indexes]
+    return [index for index in indexes if index.name in BULK_INDEXES]
+
+
+async def import_data(
+    conn: AsyncConnection,
+    paths: Dict[str, Path],
+    batch_size: int = 10_000,
+    rebuild_search_indexes: bool = False,
+) -> dict:
+    # импорт заведомо дольше таймаутов, заданных для запросов API
+    await conn.execute(text("SET LOCAL statement_timeout = 0"))
+    await conn.execute(text("SET LOCAL lock_timeout = 0"))
+    report = {}
+    for source, path in paths.items():
+        report[source] = {"loaded": await copy_to_staging(conn, source, path, batch_size)}
+
+    for table in TRIGGER_TABLES:
+        await conn.execute(text(f"ALTER TABLE {table} DISABLE TRIGGER USER"))
+    if rebuild_search_indexes:
+        # DROP INDEX блокирует таблицу до конца транзакции, в том числе для чтения
+        for index in bulk_indexes():
+            await conn.execute(DropIndex(index, if_exists=True))
+
+    for source, merge in MERGES.items():
+        if source in paths:
+            report[source].update(await merge(conn))
+
+    if rebuild_search_indexes:
+        for index in bulk_indexes():
+            await conn.execute(CreateIndex(index))
+    if "activities" in paths:
+        await conn.execute(text("SELECT rebuild_activity_closure()"))
+    for table in TRIGGER_TABLES:
+        await conn.execute(text(f"ALTER TABLE {table} ENABLE TRIGGER USER"))
+    # id заданы во входных файлах — сдвигаем последовательности
+    for table in ("activities", "buildings", "organizations"):
+        await conn.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT max(id) FROM {table}))"
+        ))
+    # доставляется после COMMIT: процессы приложения перезагрузят индексы и сбросят кэш
+    await conn.execute(
+        text("SELECT pg_notify(:channel, :payload)"),
+        {"channel": CHANNEL, "payload": '{"table": "organizations", "op": "TRUNCATE"}'},
+    )
+    for table in (*TRIGGER_TABLES, "activity_closure"):
+        await conn.execute(text(f"ANALYZE {table}"))
+    return report
+
+
+async def run(args) -> dict:
+    paths = {
+        source: Path(path)
+        for source, path in (
+            ("buildings", args.buildings),
+            ("activities", args.activities),
+            ("organizations", args.organizations),
+            ("phones", args.phones),
+            ("organization_activities", args.organization_activities),
+        )
+        if path
+    }
+    if not paths:
+        raise SystemExit("Не указано ни одного файла")
+    async with engine.begin() as conn:
+        report = await import_data(conn, paths, args.batch_size, args.rebuild_search_indexes)
+    await engine.dispose()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    for source, columns in SOURCES.items():
+        parser.add_argument(
+            "--" + source.replace("_", "-"),
+            default=None,
+            help="CSV или NDJSON, колонки: " + ", ".join(name for name, _, _ in columns),
+        )
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    parser.add_argument(
+        "--rebuild-search-indexes",
+        action="store_true",
+        help="удалить GIN/GiST-индексы до загрузки и построить заново после; блокирует чтение на время импорта",
+    )
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+from typing import Dict, List
 from pydantic import BaseModel
 from pydantic import PostgresDsn
 from pydantic_settings import (
@@ -23,6 +24,51 @@ class ApiPrefix(BaseModel):
 
 class DatabaseConfig(BaseModel):
     url: PostgresDsn
+    pool_size: int = 20
+    max_overflow: int = 10
+    # ожидание свободного соединения ограничено: при исчерпании пула лучше 503, чем невидимая очередь
+    pool_timeout: float = 5
+    pool_recycle: int = 1800
+    pool_pre_ping: bool = True
+    prepared_statement_cache_size: int = 500
+    statement_timeout_ms: int = 5000
+    lock_timeout_ms: int = 1000
+    connect_timeout: float = 5
+    # реплики только для чтения; без них всё читается с основного сервера
+    replica_urls: List[PostgresDsn] = []
+    replica_health_check_seconds: int = 10
+    # statement_timeout для отдельных эндпоинтов, по имени функции-обработчика
+    route_statement_timeout_ms: Dict[str, int] = {
+        "geo_search_orgs": 2000,
+        "geo_nearest_orgs": 2000,
+        "geo_cluster_orgs": 2000,
+        "search_orgs_by_name": 2000,
+        "search_orgs": 2000,
+    }
+
+
+class IndexesConfig(BaseModel):
+    autocomplete_refresh_seconds: int = 300
+    activity_tree_refresh_seconds: int = 300
+    # полное перечитывание связей организаций с видами деятельности; изменения между ними
+    # приходят через LISTEN/NOTIFY, без него интервал стоит уменьшить
+    activity_orgs_refresh_seconds: int = 3600
+    # LISTEN/NOTIFY: изменения данных применяются к индексам и кэшу сразу во всех процессах
+    listen_for_changes: bool = True
+
+
+class CacheConfig(BaseModel):
+    enabled: bool = True
+    ttl_seconds: int = 60
+    max_bytes: int = 64 * 1024 * 1024
+    # меньшие ответы не сжимаются
+    gzip_min_bytes: int = 1024
+
+
+class MetricsConfig(BaseModel):
+    # метрики по маршрутам на /metrics и заголовок Server-Timing
+    enabled: bool = True
+    server_timing: bool = True
 
 
 class Secret(BaseModel):
@@ -38,6 +84,9 @@ class Settings(BaseSettings):
     run: RunConfig = RunConfig()
     api: ApiPrefix = ApiPrefix()
     db: DatabaseConfig
+    indexes: IndexesConfig = IndexesConfig()
+    cache: CacheConfig = CacheConfig()
+    metrics: MetricsConfig = MetricsConfig()
     secret: Secret
 
 
@@ -1,25 +1,109 @@
-from contextlib import asynccontextmanager
-from fastapi import FastAPI
-from fastapi.responses import ORJSONResponse
+import asyncio
+import logging
+from contextlib import asynccontextmanager, suppress
+from fastapi import FastAPI, Request
+from app.api.v1.responses import ORJSONResponse
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
+from sqlalchemy.exc import DBAPIError, TimeoutError as PoolTimeoutError
 from fastapi.openapi.docs import (
     get_redoc_html,
     get_swagger_ui_html,
     get_swagger_ui_oauth2_redirect_html,
 )
 
-from app.db.database import async_session_factory, engine
+from app.api.v1.cache import CACHE_STATUS_HEADER
+from app.api.v1.pagination import NEXT_CURSOR_HEADER
+from app.config import settings
+from app.db.database import async_session_factory, engine, replicas, timeout_engines
+from app.indexes.activity_tree import activity_tree
+from app.indexes.activity_orgs import activity_org_index
+from app.indexes.autocomplete import autocomplete_index
+from app.invalidation import listen_for_changes, reload_activity_tree
+from app.metrics import PROMETHEUS_CONTENT_TYPE, MetricsMiddleware, instrument_engine, metrics
 
 
+logger = logging.getLogger(__name__)
+
+
+async def refresh_periodically(load, interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with async_session_factory() as session:
+                await load(session)
+        except Exception:
+            logger.exception("Не удалось обновить индекс: %s", load.__qualname__)
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # startup
+    async with async_session_factory() as session:
+        await activity_tree.load(session)
+        await autocomplete_index.load(session)
+        await activity_org_index.load(session)
+    background = [
+        asyncio.create_task(
+            refresh_periodically(autocomplete_index.load, settings.indexes.autocomplete_refresh_seconds)
+        ),
+        # кэш поддеревьев и объединения в индексе связей пересчитываются, только если дерево изменилось
+        asyncio.create_task(
+            refresh_periodically(reload_activity_tree, settings.indexes.activity_tree_refresh_seconds)
+        ),
+        # изменения связей приходят через LISTEN/NOTIFY; полное перечитывание — страховка
+        # на случай потерянных уведомлений, применяется к индексу по разнице
+        asyncio.create_task(
+            refresh_periodically(activity_org_index.load, settings.indexes.activity_orgs_refresh_seconds)
+        ),
+    ]
+    if settings.indexes.listen_for_changes:
+        background.append(asyncio.create_task(listen_for_changes()))
+    if replicas.engines:
+        background.append(asyncio.create_task(replicas.monitor(settings.db.replica_health_check_seconds)))
     yield
     # shutdown
+    for task in background:
+        task.cancel()
+    for task in background:
+        with suppress(asyncio.CancelledError):
+            await task
+    await replicas.dispose()
+    for target in timeout_engines():
+        await target.dispose()
     await engine.dispose()
 
 
+# код ошибки PostgreSQL query_canceled: сработал statement_timeout
+QUERY_CANCELED = "57014"
+
+
+def register_db_error_handlers(app: FastAPI):
+    @app.exception_handler(PoolTimeoutError)
+    async def pool_timeout_handler(request: Request, exc: PoolTimeoutError):
+        logger.warning("Нет свободного соединения в пуле: %s", request.url.path)
+        return ORJSONResponse(status_code=503, content={"detail": "Сервис перегружен, повторите запрос позже"})
+
+    @app.exception_handler(DBAPIError)
+    async def query_canceled_handler(request: Request, exc: DBAPIError):
+        if getattr(exc.orig, "sqlstate", None) != QUERY_CANCELED:
+            raise exc
+        logger.warning("Запрос отменён по statement_timeout: %s", request.url.path)
+        return ORJSONResponse(status_code=503, content={"detail": "Превышено время выполнения запроса"})
+
+
+def register_metrics(app: FastAPI):
+    for target in [engine, *replicas.engines, *timeout_engines()]:
+        instrument_engine(target)
+    # добавляется последним и потому снаружи всех остальных middleware
+    app.add_middleware(MetricsMiddleware, server_timing_header=settings.metrics.server_timing)
+
+    # на приложении, а не в api-роутере: без X-API-Key, как принято для Prometheus
+    @app.get("/metrics", include_in_schema=False)
+    async def prometheus_metrics():
+        return PlainTextResponse(metrics.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+
 def register_static_docs_routes(app: FastAPI):
     @app.get("/docs", include_in_schema=False)
     async def custom_swagger_ui_html():
@@ -50,7 +134,11 @@ def create_app(
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=[NEXT_CURSOR_HEADER, "ETag", CACHE_STATUS_HEADER],
     )
+    register_db_error_handlers(app)
+    if settings.metrics.enabled:
+        register_metrics(app)
     if create_custom_static_urls:
         register_static_docs_routes(app)
     return app
@@ -1,255 +1,584 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy.orm import selectinload
-from sqlalchemy import func
+from sqlalchemy import JSON, Integer, Select, and_, func, literal_column, or_, type_coerce
+from sqlalchemy.dialects.postgresql import ARRAY, aggregate_order_by
+from app.db.database import async_session_factory, read_session
+from app.db.crud.single_flight import single_flight
+from app.cache_tags import GEO, NAME, add_tags, current_tags
 from app.models import models
-from app.schemas.schemas import OrganizationOut, serialize_activity
-from math import radians, cos, sin, asin, sqrt
-from typing import List
+from app.indexes.activity_tree import ActivityNode, activity_tree
+from app.indexes.activity_orgs import activity_org_index, page_ids
+from math import radians, degrees, cos, sin, asin, sqrt, pi, floor
+from dataclasses import dataclass
+from typing import AsyncIterator, Callable, FrozenSet, List, Optional, Tuple
 
 
+Page = Tuple[List[dict], Optional[list]]
 
-async def get_by_building(db: AsyncSession, building_id: int) -> List[OrganizationOut]:
-    result = await db.execute(
-        select(models.Organization)
-        .where(models.Organization.building_id == building_id)
-        .options(
-            selectinload(models.Organization.building),
-            selectinload(models.Organization.phones),
-            selectinload(models.Organization.activities),
-            selectinload(models.Organization.activities, models.OrganizationActivity.activity),
-            selectinload(models.Organization.activities, models.OrganizationActivity.activity, models.Activity.children),
-        )
+STREAM_BATCH_SIZE = 500
+
+
+# Карточка организации целиком одним запросом: здание через join, телефоны и
+# виды деятельности — коррелированными подзапросами с агрегацией
+_phones = type_coerce(
+    select(func.coalesce(
+        func.json_agg(aggregate_order_by(
+            func.json_build_object(
+                "id", models.OrganizationPhone.id,
+                "phone_number", models.OrganizationPhone.phone_number,
+            ),
+            models.OrganizationPhone.id,
+        )),
+        literal_column("'[]'::json"),
+    ))
+    .where(models.OrganizationPhone.organization_id == models.Organization.id)
+    .scalar_subquery(),
+    JSON,
+)
+
+_activity_ids = type_coerce(
+    select(func.coalesce(
+        func.array_agg(aggregate_order_by(
+            models.OrganizationActivity.activity_id,
+            models.OrganizationActivity.id,
+        )),
+        literal_column("'{}'::integer[]"),
+    ))
+    .where(models.OrganizationActivity.organization_id == models.Organization.id)
+    .scalar_subquery(),
+    ARRAY(Integer),
+)
+
+CARD_FIELDS = ("id", "name", "building", "phones", "activities")
+
+
+@dataclass(frozen=True)
+class CardShape:
+    # какие поля карточки нужны и на сколько уровней раскрывать виды деятельности;
+    # от полей зависят колонки, подзапросы и join в запросе
+    fields: FrozenSet[str] = frozenset(CARD_FIELDS)
+    depth: int = 3
+
+
+def _card_select(stmt: Select, shape: CardShape, *extra_columns) -> Select:
+    # stmt — select(Organization) с условиями отбора; меняем только список колонок
+    fields = shape.fields
+    columns = [models.Organization.id]
+    if "name" in fields:
+        columns.append(models.Organization.name)
+    if "building" in fields:
+        columns += [
+            models.Building.id.label("building_id"),
+            models.Building.address,
+            models.Building.latitude,
+            models.Building.longitude,
+        ]
+    if "phones" in fields:
+        columns.append(_phones.label("phones"))
+    if "activities" in fields:
+        columns.append(_activity_ids.label("activity_ids"))
+    stmt = stmt.with_only_columns(*columns, *extra_columns)
+    if "building" in fields:
+        stmt = stmt.join(models.Building, models.Organization.building_id == models.Building.id)
+    return stmt
+
+
+def org_card(row, shape: CardShape) -> dict:
+    # карточка сразу в виде словаря для orjson; OrganizationOut описывает её форму в OpenAPI
+    fields = shape.fields
+    tags = current_tags.get()
+    if tags is not None:
+        # из чего собрана карточка: при изменении этих данных кэш вытеснит ответ
+        tags.add(("organization", row.id))
+        if "building" in fields:
+            tags.add(("building", row.building_id))
+        if "activities" in fields:
+            tags.update(("activity", activity_id) for activity_id in row.activity_ids)
+    card = {"id": row.id}
+    if "name" in fields:
+        card["name"] = row.name
+    if "building" in fields:
+        card["building"] = {
+            "id": row.building_id,
+            "address": row.address,
+            "latitude": row.latitude,
+            "longitude": row.longitude,
+        }
+    if "phones" in fields:
+        card["phones"] = row.phones
+    if "activities" in fields:
+        # поддеревья видов деятельности берутся из кэша дерева, а не из БД; вида деятельности,
+        # которого в дереве ещё нет (фоновое обновление не дошло), в карточке не будет
+        card["activities"] = [
+            subtree
+            for activity_id in row.activity_ids
+            if (subtree := activity_tree.subtree(activity_id, shape.depth)) is not None
+        ]
+    return card
+
+
+async def ensure_index_loaded(index):
+    # Индексы в памяти загружаются при старте приложения и обновляются в фоне; здесь —
+    # только первая загрузка, если старта не было (скрипты). С основного сервера: сессия
+    # запроса может быть на отстающей реплике
+    if not index.loaded:
+        async with async_session_factory() as session:
+            await index.ensure_loaded(session)
+
+
+def _keyset_by_id(stmt: Select, limit: int, after: Optional[list]) -> Select:
+    # keyset-пагинация по id: берём на одну запись больше, чтобы понять, есть ли следующая страница
+    if after:
+        stmt = stmt.where(models.Organization.id > after[0])
+    return stmt.order_by(models.Organization.id).limit(limit + 1)
+
+
+def _split_page(rows: list, limit: int, key: Callable) -> Tuple[list, Optional[list]]:
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, key(rows[-1])
 
+
+async def _fetch_page(db: AsyncSession, stmt: Select, limit: int, after: Optional[list], shape: CardShape) -> Page:
+    result = await db.execute(_keyset_by_id(_card_select(stmt, shape), limit, after))
+    rows, next_key = _split_page(result.all(), limit, lambda row: [row.id])
+    return [org_card(row, shape) for row in rows], next_key
+
+
+async def _hydrate_page(db: AsyncSession, org_ids, limit: int, after: Optional[list], shape: CardShape) -> Page:
+    # id уже отобраны и отсортированы индексом — из БД читается только страница
+    ids, next_key = page_ids(org_ids, limit, after)
+    if not ids:
+        return [], next_key
+    result = await db.execute(
+        _card_select(select(models.Organization).where(models.Organization.id.in_(ids)), shape)
+        .order_by(models.Organization.id)
     )
-    orgs = result.scalars().all()
-    return [
-        OrganizationOut(
-            id=org.id,
-            name=org.name,
-            building=org.building,
-            phones=org.phones,
-            activities=[
-                serialize_activity(oa.activity, level=1, max_level=3)
-                for oa in org.activities
-            ]
+    rows = result.all()
+    return [org_card(row, shape) for row in rows], next_key
+
+
+async def stream_organizations(stmt: Select, shape: CardShape, order_by=None) -> AsyncIterator[List[dict]]:
+    # серверный курсор: строки читаются и отдаются пачками, весь результат в памяти не держится.
+    # Сессия своя — ответ стримится уже после выхода из зависимостей запроса
+    stmt = _card_select(stmt, shape).order_by(*(order_by or [models.Organization.id]))
+    async with read_session() as session:
+        result = await session.stream(stmt.execution_options(yield_per=STREAM_BATCH_SIZE))
+        async for rows in result.partitions():
+            yield [org_card(row, shape) for row in rows]
+
+
+def building_orgs(building_id: int) -> Select:
+    return select(models.Organization).where(models.Organization.building_id == building_id)
+
+
+@single_flight
+async def get_by_building(db: AsyncSession, building_id: int, limit: int, shape: CardShape, after: Optional[list] = None) -> Page:
+    add_tags([("building", building_id)])
+    return await _fetch_page(db, building_orgs(building_id), limit, after, shape)
+
+
+def activity_tree_orgs(activity_id: int) -> Select:
+    # организации, у которых хотя бы один вид деятельности лежит в поддереве activity_id
+    subtree_orgs = (
+        select(models.OrganizationActivity.organization_id)
+        .join(
+            models.ActivityClosure,
+            models.ActivityClosure.descendant_id == models.OrganizationActivity.activity_id,
         )
-        for org in orgs
-    ]
+        .where(models.ActivityClosure.ancestor_id == activity_id)
+    )
+    return select(models.Organization).where(models.Organization.id.in_(subtree_orgs))
 
-async def _get_activity_descendants(db: AsyncSession, root_id: int) -> list[int]:
-    result = await db.execute(select(models.Activity))
-    activities = result.scalars().all()
-    descendants = set()
-    def collect_children(parent_id: int):
-        for activity in activities:
-            if activity.parent_id == parent_id:
-                descendants.add(activity.id)
-                collect_children(activity.id)
-    descendants.add(root_id)
-    collect_children(root_id)
-    return list(descendants)
-
-
-async def get_by_activity_tree(db: AsyncSession, activity_id: int) -> List[OrganizationOut]:
-    activity_ids = await _get_activity_descendants(db, activity_id)
-    result = await db.execute(
+
+@single_flight
+async def get_by_activity_tree(db: AsyncSession, activity_id: int, limit: int, shape: CardShape, after: Optional[list] = None) -> Page:
+    add_tags([("activity", activity_id)])
+    await ensure_index_loaded(activity_org_index)
+    return await _hydrate_page(db, activity_org_index.subtree(activity_id), limit, after, shape)
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def name_rank(name: str):
+    return func.word_similarity(name, models.Organization.name)
+
+
+def name_orgs(name: str) -> Select:
+    # ILIKE по подстроке обслуживается триграммным GIN-индексом
+    return (
         select(models.Organization)
-        .join(models.OrganizationActivity)
-        .where(models.OrganizationActivity.activity_id.in_(activity_ids))
-        .options(
-            selectinload(models.Organization.building),
-            selectinload(models.Organization.phones),
-            selectinload(models.Organization.activities)
-                .selectinload(models.OrganizationActivity.activity)
-                .selectinload(models.Activity.children),
-        )
+        .where(models.Organization.name.ilike(f"%{_escape_like(name)}%", escape="\\"))
     )
-    orgs = result.scalars().unique().all()
-    return [
-        OrganizationOut(
-            id=org.id,
-            name=org.name,
-            building=org.building,
-            phones=org.phones,
-            activities=[
-                serialize_activity(oa.activity, level=1, max_level=3)
-                for oa in org.activities
-            ]
-        )
-        for org in orgs
-    ]
 
 
-async def search_by_name(db: AsyncSession, name: str) -> List[OrganizationOut]:
+async def _fetch_ranked_page(db: AsyncSession, stmt: Select, rank, limit: int, after: Optional[list], shape: CardShape) -> Page:
+    # самые похожие названия идут первыми; курсор — пара (ранг, id)
+    stmt = _card_select(stmt, shape, rank.label("rank"))
+    if after:
+        after_rank, after_id = after
+        stmt = stmt.where(or_(
+            rank < after_rank,
+            and_(rank == after_rank, models.Organization.id > after_id),
+        ))
     result = await db.execute(
-        select(models.Organization)
-        .where(func.lower(models.Organization.name).like(f"%{name.lower()}%"))
-        .options(
-            selectinload(models.Organization.building),
-            selectinload(models.Organization.phones),
-            selectinload(models.Organization.activities)
-                .selectinload(models.OrganizationActivity.activity)
-                .selectinload(models.Activity.children)
-        )
+        stmt
+        .order_by(rank.desc(), models.Organization.id)
+        .limit(limit + 1)
     )
-    orgs = result.scalars().all()
-    return [
-        OrganizationOut(
-            id=org.id,
-            name=org.name,
-            building=org.building,
-            phones=org.phones,
-            activities=[
-                serialize_activity(oa.activity, level=1, max_level=3)
-                for oa in org.activities
-            ]
-        )
-        for org in orgs
-    ]
+    rows, next_key = _split_page(result.all(), limit, lambda row: [row.rank, row.id])
+    return [org_card(row, shape) for row in rows], next_key
 
 
-async def get_by_id(db: AsyncSession, org_id: int):
+@single_flight
+async def search_by_name(db: AsyncSession, name: str, limit: int, shape: CardShape, after: Optional[list] = None) -> Page:
+    add_tags([NAME])
+    return await _fetch_ranked_page(db, name_orgs(name), name_rank(name), limit, after, shape)
+
+
+@single_flight
+async def get_by_id(db: AsyncSession, org_id: int, shape: CardShape) -> Optional[dict]:
     result = await db.execute(
-        select(models.Organization)
-        .where(models.Organization.id == org_id)
-        .options(
-            selectinload(models.Organization.building),
-            selectinload(models.Organization.phones),
-            selectinload(models.Organization.activities).selectinload(models.OrganizationActivity.activity),
-        )
+        _card_select(select(models.Organization).where(models.Organization.id == org_id), shape)
     )
-    org = result.scalar_one_or_none()
-    if org is None:
+    row = result.one_or_none()
+    if row is None:
         return None
-    return OrganizationOut(
-        id=org.id,
-        name=org.name,
-        building=org.building,
-        phones=org.phones,
-        activities=[
-            serialize_activity(oa.activity, level=1, max_level=3)
-            for oa in org.activities
-        ]
+    return org_card(row, shape)
+
+
+@single_flight
+async def get_by_ids(db: AsyncSession, org_ids: List[int], shape: CardShape) -> Tuple[List[dict], List[int]]:
+    # один запрос на весь список; порядок ответа — порядок запроса, повторы схлопываются
+    org_ids = list(dict.fromkeys(org_ids))
+    result = await db.execute(
+        _card_select(select(models.Organization).where(models.Organization.id.in_(org_ids)), shape)
     )
+    rows = {row.id: row for row in result.all()}
+    cards = [org_card(rows[org_id], shape) for org_id in org_ids if org_id in rows]
+    missing = [org_id for org_id in org_ids if org_id not in rows]
+    return cards, missing
+
+
+# Радиус земли в километрах
+EARTH_RADIUS_KM = 6371.0
 
 
 def haversine(lat1, lon1, lat2, lon2):
-    # Радиус земли в километрах
-    R = 6371.0
     dlat = radians(lat2 - lat1)
     dlon = radians(lon2 - lon1)
     a = sin(dlat / 2) ** 2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon / 2) ** 2
     c = 2 * asin(sqrt(a))
-    return R * c
+    return EARTH_RADIUS_KM * c
 
 
-async def get_by_radius(db: AsyncSession, lat: float, lon: float, radius_km: float):
-    # все здания
-    result = await db.execute(select(models.Building))
-    buildings = result.scalars().all()
-    # фильтр по радиусу
-    nearby_ids = [
-        b.id for b in buildings if haversine(lat, lon, b.latitude, b.longitude) <= radius_km
-    ]
-    if not nearby_ids:
-        return []
-    # организации из найденных зданий
-    result = await db.execute(
-        select(models.Organization)
-        .where(models.Organization.building_id.in_(nearby_ids))
-        .options(
-            selectinload(models.Organization.building),
-            selectinload(models.Organization.phones),
-            selectinload(models.Organization.activities).selectinload(models.OrganizationActivity.activity),
+def _bounding_box(lat: float, lon: float, radius_km: float):
+    # прямоугольник, гарантированно содержащий круг радиуса radius_km
+    angular = radius_km / EARTH_RADIUS_KM
+    lat_min = lat - degrees(angular)
+    lat_max = lat + degrees(angular)
+    if lat_min <= -90 or lat_max >= 90 or angular >= pi / 2:
+        # круг задевает полюс — по долготе не ограничиваем
+        return max(lat_min, -90.0), min(lat_max, 90.0), -180.0, 180.0
+    dlon = degrees(asin(min(1.0, sin(angular) / cos(radians(lat)))))
+    lon_min = lon - dlon
+    lon_max = lon + dlon
+    if lon_min < -180 or lon_max > 180:
+        # переход через 180-й меридиан
+        lon_min, lon_max = -180.0, 180.0
+    return lat_min, lat_max, lon_min, lon_max
+
+
+def _haversine_sql(lat: float, lon: float):
+    # расстояние по большому кругу от точки до здания, считается в БД
+    dlat = func.radians(models.Building.latitude - lat)
+    dlon = func.radians(models.Building.longitude - lon)
+    a = (
+        func.power(func.sin(dlat / 2), 2)
+        + cos(radians(lat)) * func.cos(func.radians(models.Building.latitude))
+        * func.power(func.sin(dlon / 2), 2)
+    )
+    return 2 * EARTH_RADIUS_KM * func.asin(func.least(1.0, func.sqrt(a)))
+
+
+def radius_orgs(lat: float, lon: float, radius_km: float) -> Select:
+    # грубый отбор по индексу (latitude, longitude), затем точная проверка расстояния
+    lat_min, lat_max, lon_min, lon_max = _bounding_box(lat, lon, radius_km)
+    nearby_buildings = (
+        select(models.Building.id)
+        .where(
+            models.Building.latitude.between(lat_min, lat_max),
+            models.Building.longitude.between(lon_min, lon_max),
+            _haversine_sql(lat, lon) <= radius_km,
         )
     )
-    orgs = result.scalars().all()
-    return [
-        OrganizationOut(
-            id=org.id,
-            name=org.name,
-            building=org.building,
-            phones=org.phones,
-            activities=[
-                serialize_activity(oa.activity, level=1, max_level=3)
-                for oa in org.activities
-            ]
+    return select(models.Organization).where(models.Organization.building_id.in_(nearby_buildings))
+
+
+@single_flight
+async def get_by_radius(
+    db: AsyncSession,
+    lat: float,
+    lon: float,
+    radius_km: float,
+    limit: int,
+    shape: CardShape,
+    after: Optional[list] = None,
+) -> Page:
+    add_tags([GEO])
+    return await _fetch_page(db, radius_orgs(lat, lon, radius_km), limit, after, shape)
+
+
+@single_flight
+async def get_nearest(db: AsyncSession, lat: float, lon: float, k: int, shape: CardShape) -> List[dict]:
+    add_tags([GEO])
+    point = func.ll_to_earth(lat, lon)
+    building_point = func.ll_to_earth(models.Building.latitude, models.Building.longitude)
+    # k ближайших зданий, где есть организации, обходом GiST-индекса по оператору <->;
+    # k ближайших организаций гарантированно находятся в них
+    nearest_buildings = (
+        select(
+            models.Building.id,
+            (func.earth_distance(building_point, point) / 1000).label("distance_km"),
         )
-        for org in orgs
+        .where(
+            select(models.Organization.id)
+            .where(models.Organization.building_id == models.Building.id)
+            .exists()
+        )
+        .order_by(building_point.op("<->")(point))
+        .limit(k)
+        .subquery()
+    )
+    result = await db.execute(
+        _card_select(select(models.Organization), shape, nearest_buildings.c.distance_km)
+        .join(nearest_buildings, models.Organization.building_id == nearest_buildings.c.id)
+        .order_by(nearest_buildings.c.distance_km, models.Organization.id)
+        .limit(k)
+    )
+    rows = result.all()
+    return [
+        {**org_card(row, shape), "distance_km": row.distance_km}
+        for row in rows
     ]
 
 
-async def get_by_rectangle(db: AsyncSession, lat_min: float, lat_max: float, lon_min: float, lon_max: float):
-    # получение здания внутри прямоугольника
-    result = await db.execute(
-        select(models.Building).where(
-            models.Building.latitude >= lat_min,
-            models.Building.latitude <= lat_max,
-            models.Building.longitude >= lon_min,
-            models.Building.longitude <= lon_max,
+def rectangle_orgs(lat_min: float, lat_max: float, lon_min: float, lon_max: float) -> Select:
+    # здания внутри прямоугольника
+    buildings_inside = (
+        select(models.Building.id)
+        .where(
+            models.Building.latitude.between(lat_min, lat_max),
+            models.Building.longitude.between(lon_min, lon_max),
         )
     )
-    buildings = result.scalars().all()
-    if not buildings:
+    return select(models.Organization).where(models.Organization.building_id.in_(buildings_inside))
+
+
+@single_flight
+async def get_by_rectangle(
+    db: AsyncSession,
+    lat_min: float,
+    lat_max: float,
+    lon_min: float,
+    lon_max: float,
+    limit: int,
+    shape: CardShape,
+    after: Optional[list] = None,
+) -> Page:
+    add_tags([GEO])
+    return await _fetch_page(db, rectangle_orgs(lat_min, lat_max, lon_min, lon_max), limit, after, shape)
+
+
+GEOHASH_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+# область покрывается не больше чем столькими ячейками geohash: больше — длиннее условие
+# в запросе, меньше — ячейки шире области и лишних зданий читается больше
+MAX_COVER_CELLS = 16
+
+
+def geohash_encode(lat: float, lon: float, length: int) -> str:
+    # то же, что geohash_encode в БД (миграция e81b3c7f5a26)
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars = []
+    bits = ch = 0
+    even = True
+    while len(chars) < length:
+        value, bounds = (lon, lon_range) if even else (lat, lat_range)
+        mid = (bounds[0] + bounds[1]) / 2
+        if value >= mid:
+            ch = ch * 2 + 1
+            bounds[0] = mid
+        else:
+            ch = ch * 2
+            bounds[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_BASE32[ch])
+            bits = ch = 0
+    return "".join(chars)
+
+
+def geohash_cover(lat_min: float, lat_max: float, lon_min: float, lon_max: float) -> List[Tuple[str, str]]:
+    # Диапазоны [from, to) значений geohash, покрывающие прямоугольник: ячейки самой большой
+    # длины, которых хватает не больше MAX_COVER_CELLS; соседние по порядку склеиваются.
+    # Пустой список — область слишком велика, ограничивать не нужно
+    for length in range(12, 0, -1):
+        lat_step = 180 / 2 ** (5 * length // 2)
+        lon_step = 360 / 2 ** ((5 * length + 1) // 2)
+        rows = range(floor((lat_min + 90) / lat_step), floor((min(lat_max, 89.999999) + 90) / lat_step) + 1)
+        cols = range(floor((lon_min + 180) / lon_step), floor((min(lon_max, 179.999999) + 180) / lon_step) + 1)
+        if len(rows) * len(cols) <= MAX_COVER_CELLS:
+            break
+    else:
         return []
-    building_ids = [b.id for b in buildings]
+    cells = sorted({
+        geohash_encode((row + 0.5) * lat_step - 90, (col + 0.5) * lon_step - 180, length)
+        for row in rows
+        for col in cols
+    })
+    ranges = []
+    previous = None
+    for cell in cells:
+        number = 0
+        for ch in cell:
+            number = number * 32 + GEOHASH_BASE32.index(ch)
+        if ranges and number == previous + 1:
+            ranges[-1] = (ranges[-1][0], cell)
+        else:
+            ranges.append((cell, cell))
+        previous = number
+    # «{» в ASCII следует за «z»: cell + «{» больше любого geohash, начинающегося с cell
+    return [(first, last + "{") for first, last in ranges]
+
+
+@single_flight
+async def get_clusters(
+    db: AsyncSession,
+    lat_min: float,
+    lat_max: float,
+    lon_min: float,
+    lon_max: float,
+    precision: int,
+) -> List[dict]:
+    # агрегаты по ячейкам geohash: число организаций и центр масс их зданий
+    add_tags([GEO])
+    cell = func.substr(models.Building.geohash, 1, precision).label("cell")
+    # сначала отбор по индексу ix_buildings_geohash (text_pattern_ops: операторы ~>=~ и ~<~),
+    # затем точная проверка координат — ячейки выступают за границы области
+    cover = [
+        and_(models.Building.geohash.op("~>=~")(first), models.Building.geohash.op("~<~")(last))
+        for first, last in geohash_cover(lat_min, lat_max, lon_min, lon_max)
+    ]
     result = await db.execute(
-        select(models.Organization)
-        .where(models.Organization.building_id.in_(building_ids))
-        .options(
-            selectinload(models.Organization.building),
-            selectinload(models.Organization.phones),
-            selectinload(models.Organization.activities).selectinload(models.OrganizationActivity.activity),
+        select(
+            cell,
+            func.count(models.Organization.id),
+            func.avg(models.Building.latitude),
+            func.avg(models.Building.longitude),
         )
+        .join(models.Organization, models.Organization.building_id == models.Building.id)
+        .where(
+            or_(*cover) if cover else True,
+            models.Building.latitude.between(lat_min, lat_max),
+            models.Building.longitude.between(lon_min, lon_max),
+        )
+        .group_by(cell)
+        .order_by(cell)
     )
-    orgs = result.scalars().all()
     return [
-        OrganizationOut(
-            id=org.id,
-            name=org.name,
-            building=org.building,
-            phones=org.phones,
-            activities=[
-                serialize_activity(oa.activity, level=1, max_level=3)
-                for oa in org.activities
-            ]
-        )
-        for org in orgs
+        {"geohash": geohash, "count": count, "latitude": latitude, "longitude": longitude}
+        for geohash, count, latitude, longitude in result.all()
     ]
 
 
-async def get_activity_by_name(db: AsyncSession, name: str):
-    result = await db.execute(
-        select(models.Activity).where(func.lower(models.Activity.name) == name.lower())
-    )
-    return result.scalar_one_or_none()
+async def get_activity_by_name(name: str) -> Optional[ActivityNode]:
+    await ensure_index_loaded(activity_tree)
+    return activity_tree.get_by_name(name)
 
 
-async def get_by_activity_only(db: AsyncSession, activity_id: int) -> List[OrganizationOut]:
-    result = await db.execute(
-        select(models.Organization)
-        .join(models.Organization.activities)
+def activity_orgs(activity_id: int) -> Select:
+    direct_orgs = (
+        select(models.OrganizationActivity.organization_id)
         .where(models.OrganizationActivity.activity_id == activity_id)
-        .options(
-            selectinload(models.Organization.building),
-            selectinload(models.Organization.phones),
-            selectinload(models.Organization.activities)
-            .selectinload(models.OrganizationActivity.activity)
-            .selectinload(models.Activity.children)
-        )
     )
-    orgs = result.scalars().all()
-    return [
-        OrganizationOut(
-            id=org.id,
-            name=org.name,
-            building=org.building,
-            phones=org.phones,
-            activities=[
-                serialize_activity(oa.activity, level=1, max_level=3)
-                for oa in org.activities
-            ]
-        )
-        for org in orgs
-    ]
\ No newline at end of file
+    return select(models.Organization).where(models.Organization.id.in_(direct_orgs))
+
+
+@single_flight
+async def get_by_activity_only(db: AsyncSession, activity_id: int, limit: int, shape: CardShape, after: Optional[list] = None) -> Page:
+    add_tags([("activity", activity_id)])
+    await ensure_index_loaded(activity_org_index)
+    return await _hydrate_page(db, activity_org_index.direct(activity_id), limit, after, shape)
+
+
+@single_flight
+async def get_by_activities(
+    db: AsyncSession,
+    any_of: List[int],
+    all_of: List[int],
+    limit: int,
+    shape: CardShape,
+    after: Optional[list] = None,
+) -> Page:
+    # any_of — хотя бы один из видов деятельности, all_of — все сразу (с учётом подвидов)
+    add_tags(("activity", activity_id) for activity_id in {*any_of, *all_of})
+    await ensure_index_loaded(activity_org_index)
+    if any_of and all_of:
+        org_ids = sorted(set(activity_org_index.any_of(any_of)).intersection(activity_org_index.all_of(all_of)))
+    elif any_of:
+        org_ids = activity_org_index.any_of(any_of)
+    else:
+        org_ids = activity_org_index.all_of(all_of)
+    return await _hydrate_page(db, org_ids, limit, after, shape)
+
+
+def combined_orgs(
+    name: Optional[str] = None,
+    activity_id: Optional[int] = None,
+    building_id: Optional[int] = None,
+    radius: Optional[Tuple[float, float, float]] = None,
+    rectangle: Optional[Tuple[float, float, float, float]] = None,
+) -> Select:
+    # условия отдельных фильтров складываются в один WHERE: планировщик сам
+    # выбирает, с какого индекса начать, а не пересекает готовые выборки
+    filters = []
+    if name is not None:
+        filters.append(name_orgs(name))
+    if activity_id is not None:
+        filters.append(activity_tree_orgs(activity_id))
+    if building_id is not None:
+        filters.append(building_orgs(building_id))
+    if radius is not None:
+        filters.append(radius_orgs(*radius))
+    if rectangle is not None:
+        filters.append(rectangle_orgs(*rectangle))
+    return select(models.Organization).where(*(f.whereclause for f in filters))
+
+
+@single_flight
+async def search_combined(
+    db: AsyncSession,
+    limit: int,
+    shape: CardShape,
+    after: Optional[list] = None,
+    name: Optional[str] = None,
+    **filters,
+) -> Page:
+    # по метке на каждый фильтр: организация, которая стала подходить под все условия,
+    # изменилась хотя бы по одному из них
+    tags = [NAME] if name is not None else []
+    if filters.get("activity_id") is not None:
+        tags.append(("activity", filters["activity_id"]))
+    if filters.get("building_id") is not None:
+        tags.append(("building", filters["building_id"]))
+    if filters.get("radius") is not None or filters.get("rectangle") is not None:
+        tags.append(GEO)
+    add_tags(tags)
+    stmt = combined_orgs(name=name, **filters)
+    if name is not None:
+        return await _fetch_ranked_page(db, stmt, name_rank(name), limit, after, shape)
+    return await _fetch_page(db, stmt, limit, after, shape)
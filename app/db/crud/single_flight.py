@@ -0,0 +1,58 @@
+import asyncio
+import functools
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.cache_tags import add_tags, current_tags
+
+
+
+def _freeze(value: Any) -> Hashable:
+    # списки (курсоры, any_of/all_of, ids) приводятся к кортежам, чтобы войти в ключ
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    return value
+
+
+def single_flight(func: Callable[..., Awaitable]) -> Callable[..., Awaitable]:
+    # Одновременные вызовы с одинаковыми аргументами (кроме сессии) ждут одно общее
+    # вычисление. Оно идёт на сессии первого вызова, в отдельной задаче: отмена одного
+    # ожидающего (клиент отключился) не отменяет вычисление для остальных.
+    # Задача наследует contextvars первого вызова. Результат общий — менять его нельзя
+    in_flight: Dict[Tuple, asyncio.Future] = {}
+
+    async def run(db: AsyncSession, args, kwargs):
+        # метки кэша собираются в задаче и достаются каждому ожидавшему, не только первому
+        tags = set()
+        current_tags.set(tags)
+        return await func(db, *args, **kwargs), tags
+
+    async def shared(task: asyncio.Future):
+        result, tags = await asyncio.shield(task)
+        add_tags(tags)
+        return result
+
+    def forget(key, task: asyncio.Future):
+        in_flight.pop(key, None)
+        # все ждавшие могли отмениться — ошибку всё равно забираем, чтобы не было предупреждения
+        if not task.cancelled():
+            task.exception()
+
+    @functools.wraps(func)
+    async def wrapper(db: AsyncSession, *args, **kwargs):
+        key = (_freeze(args), _freeze(kwargs))
+        task = in_flight.get(key)
+        if task is not None:
+            return await shared(task)
+        task = asyncio.ensure_future(run(db, args, kwargs))
+        in_flight[key] = task
+        task.add_done_callback(functools.partial(forget, key))
+        try:
+            return await shared(task)
+        except asyncio.CancelledError:
+            # сессия первого вызова нужна задаче до конца — не отдаём её на закрытие раньше
+            await asyncio.wait({task})
+            raise
+
+    return wrapper
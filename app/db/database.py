@@ -1,12 +1,239 @@
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
-from sqlalchemy.orm import sessionmaker
+import asyncio
+import logging
+import orjson
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import Engine, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
 from app.config import settings
 
 
+logger = logging.getLogger(__name__)
 
-engine = create_async_engine(str(settings.db.url), future=True)
-async_session_factory = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+
+def _create_engine(url, statement_timeout_ms: int = settings.db.statement_timeout_ms) -> AsyncEngine:
+    return create_async_engine(
+        str(url),
+        future=True,
+        json_deserializer=orjson.loads,
+        pool_size=settings.db.pool_size,
+        max_overflow=settings.db.max_overflow,
+        pool_timeout=settings.db.pool_timeout,
+        pool_recycle=settings.db.pool_recycle,
+        pool_pre_ping=settings.db.pool_pre_ping,
+        connect_args={
+            "timeout": settings.db.connect_timeout,
+            "prepared_statement_cache_size": settings.db.prepared_statement_cache_size,
+            # значения по умолчанию для всех соединений пула
+            "server_settings": {
+                "statement_timeout": str(statement_timeout_ms),
+                "lock_timeout": str(settings.db.lock_timeout_ms),
+            },
+        },
+    )
+
+
+# statement_timeout текущего запроса, если он отличается от значения по умолчанию
+statement_timeout_ms: ContextVar[Optional[int]] = ContextVar("statement_timeout_ms", default=None)
+
+# Движки с другим statement_timeout: значение задаётся при подключении, а не отдельным
+# SET LOCAL в начале каждой транзакции. Ключ — (движок по умолчанию, таймаут)
+_timeout_engines: Dict[Tuple[Engine, int], AsyncEngine] = {}
+
+
+def _timeout_engine(target: Engine, timeout: int) -> AsyncEngine:
+    variant = _timeout_engines.get((target, timeout))
+    if variant is None:
+        variant = _create_engine(target.url.render_as_string(hide_password=False), timeout)
+        _timeout_engines[(target, timeout)] = variant
+    return variant
+
+
+def timeout_engine(target: AsyncEngine, timeout: int) -> AsyncEngine:
+    return _timeout_engine(target.sync_engine, timeout)
+
+
+def timeout_engines() -> List[AsyncEngine]:
+    return list(_timeout_engines.values())
+
+
+class TimeoutSession(Session):
+    # соединение берётся из пула с нужным statement_timeout, если запрос его переопределил
+    def get_bind(self, *args, **kwargs):
+        bind = super().get_bind(*args, **kwargs)
+        timeout = statement_timeout_ms.get()
+        if timeout is None or not isinstance(bind, Engine):
+            return bind
+        return _timeout_engine(bind, timeout).sync_engine
+
+
+engine = _create_engine(settings.db.url)
+async_session_factory = sessionmaker(
+    engine, expire_on_commit=False, class_=AsyncSession, sync_session_class=TimeoutSession
+)
+
+
+# как часто после изменения данных проверять, применили ли его реплики
+REPLAY_POLL_SECONDS = 0.1
+
+
+def parse_lsn(value: str) -> int:
+    # позиция в WAL вида '16/B374D848' -> число, чтобы сравнивать
+    high, low = value.split("/")
+    return (int(high, 16) << 32) + int(low, 16)
+
+
+class ReplicaSet:
+    # Реплики для чтения: из исправных берётся наименее занятая (по числу выданных
+    # соединений пула), при равенстве — по кругу. Неисправная исключается до
+    # следующей успешной проверки
+    def __init__(self, engines: List[AsyncEngine]):
+        self.engines = engines
+        self.healthy = [True] * len(engines)
+        # до какой позиции WAL дошла каждая реплика и до какой должна дойти, чтобы
+        # её ответы можно было кэшировать (см. require)
+        self.replayed = [0] * len(engines)
+        self.required_lsn = 0
+        self._next = 0
+        self._catching_up: Optional[asyncio.Task] = None
+
+    def pick(self) -> Optional[AsyncEngine]:
+        count = len(self.engines)
+        if not count:
+            return None
+        start = self._next
+        self._next = (start + 1) % count
+        candidates = [
+            self.engines[(start + i) % count]
+            for i in range(count)
+            if self.healthy[(start + i) % count]
+        ]
+        return min(candidates, key=lambda replica: replica.pool.checkedout(), default=None)
+
+    def mark_down(self, replica: AsyncEngine):
+        index = self.engines.index(replica)
+        if self.healthy[index]:
+            logger.warning("Реплика %s недоступна, чтение идёт с основного сервера", replica.url.host)
+        self.healthy[index] = False
+
+    async def check(self):
+        for index, replica in enumerate(self.engines):
+            try:
+                async with replica.connect() as conn:
+                    # не реплика (pg_last_wal_replay_lsn() = NULL) — свой текущий WAL
+                    lsn = (await conn.execute(text(
+                        "SELECT coalesce(pg_last_wal_replay_lsn(), pg_current_wal_lsn())::text"
+                    ))).scalar()
+            except (OSError, DBAPIError, asyncio.TimeoutError):
+                self.mark_down(replica)
+            else:
+                self.replayed[index] = parse_lsn(lsn)
+                if not self.healthy[index]:
+                    logger.info("Реплика %s снова доступна", replica.url.host)
+                self.healthy[index] = True
+
+    def caught_up(self) -> bool:
+        return all(
+            lsn >= self.required_lsn
+            for lsn, healthy in zip(self.replayed, self.healthy)
+            if healthy
+        )
+
+    def require(self, lsn: int):
+        # Данные изменились на основном сервере в позиции lsn: пока исправные реплики её
+        # не применили, с них читаются старые данные, и такие ответы не кэшируются
+        self.required_lsn = max(self.required_lsn, lsn)
+        if self.engines and not self.caught_up() and (self._catching_up is None or self._catching_up.done()):
+            self._catching_up = asyncio.create_task(self._catch_up())
+
+    async def _catch_up(self):
+        while not self.caught_up():
+            await asyncio.sleep(REPLAY_POLL_SECONDS)
+            await self.check()
+
+    async def monitor(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            await self.check()
+
+    async def dispose(self):
+        if self._catching_up is not None:
+            self._catching_up.cancel()
+        for replica in self.engines:
+            await replica.dispose()
+
+
+replicas = ReplicaSet([_create_engine(url) for url in settings.db.replica_urls])
+
+# движки для таймаутов из настроек создаются сразу, чтобы их видели метрики и lifespan
+for _timeout in set(settings.db.route_statement_timeout_ms.values()):
+    for _target in [engine, *replicas.engines]:
+        timeout_engine(_target, _timeout)
+
+
+class ReadSession(AsyncSession):
+    # Сессия на реплике. Если реплика не дала соединение, строк ещё не было и повтор
+    # безопасен: реплика исключается, и запрос один раз повторяется на основном сервере
+    sync_session_class = TimeoutSession
+    replica: Optional[AsyncEngine] = None
+
+    async def _connect(self):
+        replica, self.replica = self.replica, None
+        if replica is None:
+            return
+        try:
+            await self.connection()
+        except (OSError, DBAPIError, asyncio.TimeoutError):
+            replicas.mark_down(replica)
+            await self.rollback()
+            self.sync_session.bind = engine.sync_engine
+
+    async def execute(self, *args, **kwargs):
+        await self._connect()
+        return await super().execute(*args, **kwargs)
+
+    async def scalar(self, *args, **kwargs):
+        await self._connect()
+        return await super().scalar(*args, **kwargs)
+
+    async def stream(self, *args, **kwargs):
+        await self._connect()
+        return await super().stream(*args, **kwargs)
+
+    async def get(self, *args, **kwargs):
+        await self._connect()
+        return await super().get(*args, **kwargs)
+
+
+@asynccontextmanager
+async def read_session():
+    # Сессия на реплике, без исправных реплик — на основном сервере. Соединение берётся
+    # при первом запросе, а не заранее: эндпоинт, которому БД не понадобилась, не держит его.
+    # Реплика, на которой соединение оборвалось, исключается до следующей проверки монитора
+    replica = replicas.pick()
+    if replica is None:
+        async with async_session_factory() as session:
+            yield session
+        return
+    async with ReadSession(bind=replica, expire_on_commit=False) as session:
+        session.replica = replica
+        try:
+            yield session
+        except (OSError, asyncio.TimeoutError):
+            replicas.mark_down(replica)
+            raise
+        except DBAPIError as exc:
+            if exc.connection_invalidated:
+                replicas.mark_down(replica)
+            raise
 
 async def get_db():
     async with async_session_factory() as session:
         yield session
+
+async def get_read_db():
+    async with read_session() as session:
+        yield session
@@ -0,0 +1,18 @@
+from fastapi import Request
+from app.config import settings
+from app.db.database import statement_timeout_ms
+
+
+
+async def route_statement_timeout(request: Request):
+    route = request.scope.get("route")
+    timeout = settings.db.route_statement_timeout_ms.get(getattr(route, "name", None))
+    if timeout is None:
+        yield
+        return
+    # значение действует только в пределах запроса этого эндпоинта
+    token = statement_timeout_ms.set(timeout)
+    try:
+        yield
+    finally:
+        statement_timeout_ms.reset(token)
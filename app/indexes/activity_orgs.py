@@ -0,0 +1,161 @@
+from array import array
+from bisect import bisect_right
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from app.models import models
+from app.indexes.activity_tree import activity_tree
+
+
+def _sorted_ids(ids: Iterable[int]) -> array:
+    return array("i", sorted(set(ids)))
+
+
+class ActivityOrgIndex:
+    # Обратный индекс: вид деятельности -> отсортированный массив id организаций,
+    # отдельно прямые привязки и объединение по всему поддереву, плюс обратная карта
+    # организация -> её виды деятельности. Запросы по видам деятельности решаются
+    # операциями над множествами, из БД догружается только итоговая страница
+    def __init__(self):
+        self.loaded = False
+        self._by_org: Dict[int, FrozenSet[int]] = {}
+        self._direct: Dict[int, array] = {}
+        self._subtree: Dict[int, array] = {}
+        self._tree_version: Optional[int] = None
+
+    def build(self, rows: Iterable[Tuple[int, int]]):
+        by_org: Dict[int, Set[int]] = {}
+        for org_id, activity_id in rows:
+            by_org.setdefault(org_id, set()).add(activity_id)
+        self._by_org = {org_id: frozenset(ids) for org_id, ids in by_org.items()}
+        direct: Dict[int, List[int]] = {}
+        for org_id, activity_ids in self._by_org.items():
+            for activity_id in activity_ids:
+                direct.setdefault(activity_id, []).append(org_id)
+        self._direct = {activity_id: _sorted_ids(org_ids) for activity_id, org_ids in direct.items()}
+        self._rebuild_subtrees()
+        self.loaded = True
+
+    def _rebuild_subtrees(self):
+        # объединения поддеревьев снизу вверх: узел = свои организации + объединения детей
+        subtree: Dict[int, array] = {}
+        for activity_id in activity_tree.bottom_up():
+            org_ids = set(self._direct.get(activity_id, ()))
+            for child_id in activity_tree.children(activity_id):
+                org_ids.update(subtree.get(child_id, ()))
+            if org_ids:
+                subtree[activity_id] = _sorted_ids(org_ids)
+        self._subtree = subtree
+        self._tree_version = activity_tree.version
+
+    def update(self, changes: Dict[int, FrozenSet[int]]) -> Set[int]:
+        # новые наборы видов деятельности для части организаций (пустой — организации больше нет);
+        # пересчитываются только затронутые виды деятельности и их предки. Возвращает виды
+        # деятельности, у которых изменился список прямых привязок
+        touched: Set[int] = set()
+        for org_id, activity_ids in changes.items():
+            previous = self._by_org.get(org_id, frozenset())
+            if previous == activity_ids:
+                continue
+            for activity_id in previous - activity_ids:
+                direct = set(self._direct.get(activity_id, ()))
+                direct.discard(org_id)
+                self._direct[activity_id] = _sorted_ids(direct)
+            for activity_id in activity_ids - previous:
+                self._direct[activity_id] = _sorted_ids([*self._direct.get(activity_id, ()), org_id])
+            touched |= previous ^ activity_ids
+            if activity_ids:
+                self._by_org[org_id] = activity_ids
+            else:
+                self._by_org.pop(org_id, None)
+        if not touched:
+            return touched
+        if self._tree_version != activity_tree.version:
+            self._rebuild_subtrees()
+            return touched
+        ancestors = set()
+        for activity_id in touched:
+            ancestors.update(activity_tree.ancestors(activity_id))
+        for activity_id in activity_tree.bottom_up(ancestors):
+            org_ids = set(self._direct.get(activity_id, ()))
+            for child_id in activity_tree.children(activity_id):
+                org_ids.update(self._subtree.get(child_id, ()))
+            self._subtree[activity_id] = _sorted_ids(org_ids)
+        return touched
+
+    async def _fetch(self, db: AsyncSession, org_ids: Optional[List[int]] = None) -> List[Tuple[int, int]]:
+        stmt = select(
+            models.OrganizationActivity.organization_id,
+            models.OrganizationActivity.activity_id,
+        )
+        if org_ids is not None:
+            stmt = stmt.where(models.OrganizationActivity.organization_id.in_(org_ids))
+        result = await db.execute(stmt)
+        return result.all()
+
+    async def load(self, db: AsyncSession):
+        await activity_tree.ensure_loaded(db)
+        rows = await self._fetch(db)
+        if not self.loaded:
+            self.build(rows)
+            return
+        # повторная загрузка применяется как разница с текущим состоянием
+        current: Dict[int, Set[int]] = {}
+        for org_id, activity_id in rows:
+            current.setdefault(org_id, set()).add(activity_id)
+        changes = {org_id: frozenset() for org_id in self._by_org.keys() - current.keys()}
+        changes.update((org_id, frozenset(ids)) for org_id, ids in current.items())
+        self.update(changes)
+
+    async def reload_organizations(self, db: AsyncSession, org_ids: List[int]) -> Set[int]:
+        rows = await self._fetch(db, org_ids)
+        changes: Dict[int, Set[int]] = {org_id: set() for org_id in org_ids}
+        for org_id, activity_id in rows:
+            changes[org_id].add(activity_id)
+        return self.update({org_id: frozenset(ids) for org_id, ids in changes.items()})
+
+    async def ensure_loaded(self, db: AsyncSession):
+        if not self.loaded:
+            await self.load(db)
+
+    def sync_tree(self):
+        # после перезагрузки дерева, в фоновой задаче — не в запросе: пересчёт идёт по всем связям
+        if self.loaded and self._tree_version != activity_tree.version:
+            self._rebuild_subtrees()
+
+    def direct(self, activity_id: int) -> array:
+        return self._direct.get(activity_id, array("i"))
+
+    def subtree(self, activity_id: int) -> array:
+        return self._subtree.get(activity_id, array("i"))
+
+    def any_of(self, activity_ids: Iterable[int]) -> List[int]:
+        org_ids: Set[int] = set()
+        for activity_id in activity_ids:
+            org_ids.update(self.subtree(activity_id))
+        return sorted(org_ids)
+
+    def all_of(self, activity_ids: Iterable[int]) -> List[int]:
+        # пересечение начинаем с самого короткого массива
+        arrays = sorted((self.subtree(activity_id) for activity_id in activity_ids), key=len)
+        if not arrays:
+            return []
+        org_ids = set(arrays[0])
+        for other in arrays[1:]:
+            if not org_ids:
+                break
+            org_ids.intersection_update(other)
+        return sorted(org_ids)
+
+
+def page_ids(org_ids, limit: int, after: Optional[list]) -> Tuple[List[int], Optional[list]]:
+    # срез отсортированного списка id после курсора; курсор — последний id страницы
+    start = bisect_right(org_ids, after[0]) if after else 0
+    chunk = list(org_ids[start:start + limit + 1])
+    if len(chunk) <= limit:
+        return chunk, None
+    chunk = chunk[:limit]
+    return chunk, [chunk[-1]]
+
+
+activity_org_index = ActivityOrgIndex()
@@ -0,0 +1,123 @@
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from app.models import models
+
+
+
+@dataclass(frozen=True)
+class ActivityNode:
+    id: int
+    name: str
+    parent_id: Optional[int]
+
+
+class ActivityTree:
+    # Дерево видов деятельности в памяти: список смежности, глубина узлов и индекс по имени
+    def __init__(self):
+        self.loaded = False
+        # растёт, только если дерево действительно изменилось, — по нему зависимые индексы
+        # понимают, что пора пересчитать свои данные
+        self.version = 0
+        self._nodes: Dict[int, ActivityNode] = {}
+        self._children: Dict[Optional[int], List[int]] = {}
+        self._by_name: Dict[str, int] = {}
+        self._depth: Dict[int, int] = {}
+        # готовые к сериализации поддеревья по ключу (activity_id, depth);
+        # общие для всех ответов, поэтому менять их нельзя
+        self._subtrees: Dict[Tuple[int, int], dict] = {}
+
+    def build(self, rows: Iterable[Tuple[int, str, Optional[int]]]):
+        nodes: Dict[int, ActivityNode] = {}
+        for activity_id, name, parent_id in rows:
+            nodes[activity_id] = ActivityNode(activity_id, name, parent_id)
+        if self.loaded and nodes == self._nodes:
+            # периодическая перезагрузка без изменений: кэш поддеревьев остаётся в силе
+            return
+
+        children: Dict[Optional[int], List[int]] = {}
+        by_name: Dict[str, int] = {}
+        for activity_id in sorted(nodes):
+            node = nodes[activity_id]
+            children.setdefault(node.parent_id, []).append(activity_id)
+            by_name.setdefault(node.name.lower(), activity_id)
+
+        roots = [
+            activity_id for activity_id in sorted(nodes)
+            if nodes[activity_id].parent_id not in nodes
+        ]
+        # обход в ширину от корней; узлы в кольце parent_id недостижимы и глубины не получают
+        depth: Dict[int, int] = {root: 0 for root in roots}
+        level = roots
+        while level:
+            level = [child_id for activity_id in level for child_id in children.get(activity_id, ())]
+            for child_id in level:
+                depth[child_id] = depth[nodes[child_id].parent_id] + 1
+
+        self._nodes = nodes
+        self._children = children
+        self._by_name = by_name
+        self._depth = depth
+        self._subtrees = {}
+        self.version += 1
+        self.loaded = True
+
+    async def load(self, db: AsyncSession):
+        result = await db.execute(
+            select(models.Activity.id, models.Activity.name, models.Activity.parent_id)
+        )
+        self.build(result.all())
+
+    async def ensure_loaded(self, db: AsyncSession):
+        if not self.loaded:
+            await self.load(db)
+
+    def get_by_name(self, name: str) -> Optional[ActivityNode]:
+        activity_id = self._by_name.get(name.lower())
+        return self._nodes.get(activity_id) if activity_id is not None else None
+
+    def children(self, activity_id: int) -> List[int]:
+        return self._children.get(activity_id, [])
+
+    def subtree(self, activity_id: int, depth: int) -> Optional[dict]:
+        # вид деятельности в форме ActivityOut: depth уровней, на последнем children = None
+        key = (activity_id, depth)
+        subtree = self._subtrees.get(key)
+        if subtree is None:
+            node = self._nodes.get(activity_id)
+            if node is None:
+                return None
+            subtree = {
+                "id": node.id,
+                "name": node.name,
+                "parent_id": node.parent_id,
+                "children": [
+                    self.subtree(child_id, depth - 1)
+                    for child_id in self.children(activity_id)
+                ] if depth > 1 else None,
+            }
+            self._subtrees[key] = subtree
+        return subtree
+
+    def ancestors(self, activity_id: int) -> List[int]:
+        # сам узел и все его предки до корня
+        chain = []
+        node = self._nodes.get(activity_id)
+        while node is not None and len(chain) <= len(self._nodes):
+            chain.append(node.id)
+            node = self._nodes.get(node.parent_id)
+        return chain
+
+    def bottom_up(self, activity_ids: Optional[Iterable[int]] = None) -> List[int]:
+        # узлы от глубоких к мелким: потомки идут раньше предков
+        if activity_ids is None:
+            activity_ids = self._depth
+        return sorted(
+            (activity_id for activity_id in activity_ids if activity_id in self._depth),
+            key=self._depth.__getitem__,
+            reverse=True,
+        )
+
+
+activity_tree = ActivityTree()
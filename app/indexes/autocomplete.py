@@ -0,0 +1,164 @@
+import asyncio
+from bisect import bisect_left, insort
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from app.models import models
+
+
+
+# ключи обрезаются, чтобы индекс не хранил копии длинных названий целиком
+MAX_KEY_LENGTH = 32
+# корзины по первым символам ключа: точечное изменение сдвигает только свою корзину
+BUCKET_PREFIX = 2
+# пачку больше этой индекс не правит по ключу, а пересобирает в отдельном потоке
+REBUILD_BATCH_SIZE = 1000
+
+# (ключ, вид, id, смещение слова, название)
+Entry = Tuple[str, str, int, int, str]
+
+
+def _word_starts(name: str) -> List[int]:
+    return [
+        i for i, ch in enumerate(name)
+        if ch.isalnum() and (i == 0 or not name[i - 1].isalnum())
+    ]
+
+
+def _entries(kind: str, item_id: int, name: str) -> List[Entry]:
+    lower = name.lower()
+    return [
+        (lower[offset:offset + MAX_KEY_LENGTH], kind, item_id, offset, name)
+        for offset in _word_starts(lower)
+    ]
+
+
+def _bucketed(names: Dict[Tuple[str, int], str]) -> Dict[str, List[Entry]]:
+    buckets: Dict[str, List[Entry]] = {}
+    for (kind, item_id), name in names.items():
+        for entry in _entries(kind, item_id, name):
+            buckets.setdefault(entry[0][:BUCKET_PREFIX], []).append(entry)
+    for bucket in buckets.values():
+        bucket.sort()
+    return buckets
+
+
+class AutocompleteIndex:
+    # Отсортированные ключи (название с начала каждого слова, в нижнем регистре),
+    # разложенные по корзинам первых символов, и бинарный поиск по префиксу
+    def __init__(self):
+        self.loaded = False
+        self._buckets: Dict[str, List[Entry]] = {}
+        self._bucket_names: List[str] = []
+        self._names: Dict[Tuple[str, int], str] = {}
+        # меняется при каждой правке — пересборка в потоке не затирает более свежую
+        self._version = 0
+
+    def _install(self, buckets: Dict[str, List[Entry]], names: Dict[Tuple[str, int], str]):
+        self._buckets = buckets
+        self._bucket_names = sorted(buckets)
+        self._names = names
+        self._version += 1
+        self.loaded = True
+
+    def build(self, items: Iterable[Tuple[str, int, str]]):
+        names = {(kind, item_id): name for kind, item_id, name in items}
+        self._install(_bucketed(names), names)
+
+    def update(self, kind: str, item_id: int, name: Optional[str]):
+        # точечная замена ключей одного названия; name=None — запись удалена
+        self._version += 1
+        old_name = self._names.pop((kind, item_id), None)
+        if old_name is not None:
+            for entry in _entries(kind, item_id, old_name):
+                bucket_name = entry[0][:BUCKET_PREFIX]
+                bucket = self._buckets[bucket_name]
+                i = bisect_left(bucket, entry)
+                if i < len(bucket) and bucket[i] == entry:
+                    del bucket[i]
+                if not bucket:
+                    del self._buckets[bucket_name]
+                    del self._bucket_names[bisect_left(self._bucket_names, bucket_name)]
+        if name is not None:
+            self._names[(kind, item_id)] = name
+            for entry in _entries(kind, item_id, name):
+                bucket_name = entry[0][:BUCKET_PREFIX]
+                bucket = self._buckets.get(bucket_name)
+                if bucket is None:
+                    bucket = self._buckets[bucket_name] = []
+                    insort(self._bucket_names, bucket_name)
+                insort(bucket, entry)
+
+    async def apply(self, changes: Dict[Tuple[str, int], Optional[str]]):
+        if len(changes) <= REBUILD_BATCH_SIZE:
+            for (kind, item_id), name in changes.items():
+                self.update(kind, item_id, name)
+            return
+        # большая пачка: одна сортировка всего индекса вне цикла событий вместо
+        # тысяч вставок в корзины; до подмены запросы читают старые корзины
+        version = self._version
+        names = {**self._names, **changes}
+        names = {key: name for key, name in names.items() if name is not None}
+        buckets = await asyncio.to_thread(_bucketed, names)
+        if self._version != version:
+            # пока шла пересборка, индекс перезагрузили — накладываем изменения поверх
+            for (kind, item_id), name in changes.items():
+                self.update(kind, item_id, name)
+            return
+        self._install(buckets, names)
+
+    async def reload_items(self, db: AsyncSession, kind: str, item_ids: Iterable[int]):
+        model = models.Organization if kind == "organization" else models.Activity
+        item_ids = list(item_ids)
+        result = await db.execute(select(model.id, model.name).where(model.id.in_(item_ids)))
+        names = dict(result.all())
+        await self.apply({(kind, item_id): names.get(item_id) for item_id in item_ids})
+
+    async def load(self, db: AsyncSession):
+        organizations = await db.execute(select(models.Organization.id, models.Organization.name))
+        activities = await db.execute(select(models.Activity.id, models.Activity.name))
+        names = {("organization", org_id): name for org_id, name in organizations.all()}
+        names.update((("activity", activity_id), name) for activity_id, name in activities.all())
+        self._install(await asyncio.to_thread(_bucketed, names), names)
+
+    async def ensure_loaded(self, db: AsyncSession):
+        if not self.loaded:
+            await self.load(db)
+
+    def _probe_buckets(self, probe: str) -> List[List[Entry]]:
+        if len(probe) >= BUCKET_PREFIX:
+            bucket = self._buckets.get(probe[:BUCKET_PREFIX])
+            return [bucket] if bucket is not None else []
+        # короткий префикс: все корзины, начинающиеся с него, по порядку
+        names = self._bucket_names
+        buckets = []
+        i = bisect_left(names, probe)
+        while i < len(names) and names[i].startswith(probe):
+            buckets.append(self._buckets[names[i]])
+            i += 1
+        return buckets
+
+    def suggest(self, prefix: str, limit: int) -> List[Tuple[str, int, str]]:
+        prefix = prefix.strip().lower()
+        if not prefix:
+            return []
+        probe = prefix[:MAX_KEY_LENGTH]
+        seen = set()
+        suggestions = []
+        for bucket in self._probe_buckets(probe):
+            i = bisect_left(bucket, (probe,))
+            while i < len(bucket) and bucket[i][0].startswith(probe):
+                _, kind, item_id, offset, name = bucket[i]
+                i += 1
+                if len(prefix) > MAX_KEY_LENGTH and not name.lower().startswith(prefix, offset):
+                    continue
+                if (kind, item_id) in seen:
+                    continue
+                seen.add((kind, item_id))
+                suggestions.append((kind, item_id, name))
+                if len(suggestions) >= limit:
+                    return suggestions
+        return suggestions
+
+
+autocomplete_index = AutocompleteIndex()
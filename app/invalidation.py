@@ -0,0 +1,167 @@
+import asyncio
+import logging
+from contextlib import suppress
+from typing import Iterable, List, Optional, Set
+import asyncpg
+import orjson
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.api.v1.cache import response_cache
+from app.cache_tags import GEO, NAME
+from app.db.database import async_session_factory, engine, parse_lsn, replicas
+from app.indexes.activity_orgs import activity_org_index
+from app.indexes.activity_tree import activity_tree
+from app.indexes.autocomplete import autocomplete_index
+from app.models import models
+
+
+logger = logging.getLogger(__name__)
+
+# канал, в который пишут триггеры notify_data_change/notify_data_truncate
+CHANNEL = "data_changed"
+# события, пришедшие почти одновременно, применяются одной пачкой
+DEBOUNCE_SECONDS = 0.1
+# без событий соединение проверяется запросом — полуоткрытое соединение иначе не заметить
+KEEPALIVE_SECONDS = 30
+RECONNECT_SECONDS = 5
+
+
+async def reload_activity_tree(session: AsyncSession):
+    # объединения поддеревьев в индексе связей пересчитываются, только если дерево изменилось
+    await activity_tree.load(session)
+    activity_org_index.sync_tree()
+
+
+async def _wal_lsn(session: AsyncSession) -> Optional[int]:
+    # позиция WAL основного сервера, не раньше изменений из пришедших событий: до неё
+    # должны дойти реплики, прежде чем их ответы снова попадут в кэш
+    if not replicas.engines:
+        return None
+    return parse_lsn((await session.execute(text("SELECT pg_current_wal_lsn()::text"))).scalar())
+
+
+def _activity_tags(activity_ids: Iterable[int]) -> Set[tuple]:
+    # список по виду деятельности и поддерево в карточке меняются вместе с любым потомком
+    return {
+        ("activity", ancestor_id)
+        for activity_id in activity_ids
+        for ancestor_id in activity_tree.ancestors(activity_id)
+    }
+
+
+async def full_reload():
+    async with async_session_factory() as session:
+        lsn = await _wal_lsn(session)
+        await reload_activity_tree(session)
+        await autocomplete_index.load(session)
+        await activity_org_index.load(session)
+    # TRUNCATE или события, потерянные за время разрыва: что изменилось, не известно
+    response_cache.clear()
+    if lsn is not None:
+        replicas.require(lsn)
+
+
+async def apply_changes(events: List[dict]):
+    # перестраивается только то, что зависит от изменённых таблиц и строк
+    if any(event["op"] == "TRUNCATE" for event in events):
+        await full_reload()
+        return
+    activity_ids = {event["id"] for event in events if event["table"] == "activities"}
+    org_ids = {event["id"] for event in events if event["table"] == "organizations"}
+    building_ids = {event["id"] for event in events if event["table"] == "buildings"}
+    linked_org_ids = org_ids | {
+        event["organization_id"] for event in events if event["table"] == "organization_activities"
+    }
+    # метки ответов, которые устарели (см. app.cache_tags): карточки изменённых организаций
+    # (в том числе их телефонов и видов деятельности) и зданий
+    tags = {
+        ("organization", event["organization_id"])
+        for event in events
+        if event.get("organization_id") is not None
+    }
+    tags.update(("building", building_id) for building_id in building_ids)
+    if building_ids:
+        tags.add(GEO)
+    async with async_session_factory() as session:
+        lsn = await _wal_lsn(session)
+        if activity_ids:
+            # дерево небольшое и перестраивается целиком вместе с кэшем поддеревьев;
+            # вид деятельности мог переехать — предки и до, и после
+            tags |= _activity_tags(activity_ids)
+            await reload_activity_tree(session)
+            tags |= _activity_tags(activity_ids)
+            tags.add(NAME)
+            await autocomplete_index.reload_items(session, "activity", activity_ids)
+        if org_ids:
+            # новое название, здание или координаты: поиск по названию, геопоиск и список
+            # нынешнего здания. Из списков, где организация была, её уберёт её же метка
+            tags.update((NAME, GEO))
+            result = await session.execute(
+                select(models.Organization.building_id).where(models.Organization.id.in_(org_ids))
+            )
+            tags.update(("building", building_id) for building_id in result.scalars())
+            await autocomplete_index.reload_items(session, "organization", org_ids)
+        if linked_org_ids:
+            touched = await activity_org_index.reload_organizations(session, sorted(linked_org_ids))
+            tags |= _activity_tags(touched)
+    # после обновления индексов: ответ, собранный раньше, мог взять из них старые данные
+    response_cache.evict(tags)
+    if lsn is not None:
+        replicas.require(lsn)
+
+
+def _connect_params() -> dict:
+    # те же параметры подключения, что у пула (в том числе host из query-строки URL)
+    _, params = engine.dialect.create_connect_args(engine.url)
+    return params
+
+
+async def _next_batch(conn: asyncpg.Connection, queue: asyncio.Queue) -> Optional[List[dict]]:
+    # None — соединение потеряно
+    while True:
+        try:
+            payload = await asyncio.wait_for(queue.get(), KEEPALIVE_SECONDS)
+            break
+        except asyncio.TimeoutError:
+            try:
+                await conn.execute("SELECT 1")
+            except (OSError, asyncpg.PostgresError, asyncpg.InterfaceError):
+                return None
+    await asyncio.sleep(DEBOUNCE_SECONDS)
+    payloads = [payload]
+    while not queue.empty():
+        payloads.append(queue.get_nowait())
+    if None in payloads:
+        return None
+    return [orjson.loads(payload) for payload in payloads]
+
+
+async def listen_for_changes():
+    # Отдельное соединение asyncpg вне пула SQLAlchemy: LISTEN держит его всё время.
+    # После переподключения события за время разрыва потеряны — перезагружается всё
+    reconnected = False
+    while True:
+        try:
+            conn = await asyncpg.connect(**_connect_params())
+        except (OSError, asyncpg.PostgresError):
+            logger.warning("Нет соединения для LISTEN %s, повтор через %s с", CHANNEL, RECONNECT_SECONDS)
+            reconnected = True
+            await asyncio.sleep(RECONNECT_SECONDS)
+            continue
+        queue: asyncio.Queue = asyncio.Queue()
+        try:
+            conn.add_termination_listener(lambda _conn: queue.put_nowait(None))
+            await conn.add_listener(CHANNEL, lambda _conn, _pid, _channel, payload: queue.put_nowait(payload))
+            if reconnected:
+                await full_reload()
+            reconnected = True
+            while (events := await _next_batch(conn, queue)) is not None:
+                try:
+                    await apply_changes(events)
+                except Exception:
+                    logger.exception("Не удалось применить изменения данных")
+        except (OSError, asyncpg.PostgresError, asyncpg.InterfaceError):
+            logger.exception("Соединение для LISTEN %s потеряно", CHANNEL)
+        finally:
+            with suppress(Exception):
+                await conn.close(timeout=1)
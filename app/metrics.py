@@ -0,0 +1,223 @@
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Sequence, Tuple
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+ROW_BUCKETS = (0, 1, 10, 50, 100, 500, 1000, 5000, 10000, 100000)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+class RequestStats:
+    __slots__ = ("db_seconds", "statements", "rows", "serialization_seconds")
+
+    def __init__(self):
+        self.db_seconds = 0.0
+        self.statements = 0
+        self.rows = 0
+        self.serialization_seconds = 0.0
+
+
+# счётчики текущего запроса; вне HTTP-запроса (фоновые задачи) — None, и ничего не считается
+current_request: ContextVar[Optional[RequestStats]] = ContextVar("current_request", default=None)
+
+
+@contextmanager
+def measure_serialization():
+    stats = current_request.get()
+    if stats is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.serialization_seconds += time.perf_counter() - started
+
+
+def count_rows(count: int):
+    stats = current_request.get()
+    if stats is not None:
+        stats.rows += count
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str]):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.series: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, labels: Tuple[str, ...], value: float = 1):
+        self.series[labels] = self.series.get(labels, 0) + value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self.series.items()):
+            lines.append(f"{self.name}{_labels(self.label_names, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    # в наблюдении — только поиск корзины и два сложения; накопительные суммы считаются при выдаче
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str], buckets: Sequence[float]):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        # значения меток -> (число наблюдений по корзинам, последняя — +Inf; сумма)
+        self.series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, labels: Tuple[str, ...], value: float):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total) in sorted(self.series.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {cumulative}")
+        return lines
+
+
+class Metrics:
+    # у каждого процесса uvicorn свои значения; Prometheus различает их по instance
+    def __init__(self):
+        labels = ("method", "route")
+        self.requests = Counter("http_requests_total", "Обработано запросов", (*labels, "status"))
+        self.duration = Histogram(
+            "http_request_duration_seconds", "Время обработки запроса", labels, LATENCY_BUCKETS
+        )
+        self.db_time = Histogram(
+            "http_request_db_seconds", "Время выполнения SQL за запрос", labels, LATENCY_BUCKETS
+        )
+        self.statements = Histogram(
+            "http_request_db_statements", "SQL-запросов за запрос", labels, STATEMENT_BUCKETS
+        )
+        self.rows = Histogram("http_request_db_rows", "Строк получено из БД за запрос", labels, ROW_BUCKETS)
+        self.serialization = Histogram(
+            "http_request_serialization_seconds", "Время сериализации ответа", labels, LATENCY_BUCKETS
+        )
+        self.response_size = Histogram(
+            "http_response_size_bytes", "Размер тела ответа", labels, SIZE_BUCKETS
+        )
+
+    def observe(self, method: str, route: str, status: int, duration: float, stats: RequestStats, size: int):
+        labels = (method, route)
+        self.requests.inc((method, route, str(status)))
+        self.duration.observe(labels, duration)
+        self.db_time.observe(labels, stats.db_seconds)
+        self.statements.observe(labels, stats.statements)
+        self.rows.observe(labels, stats.rows)
+        self.serialization.observe(labels, stats.serialization_seconds)
+        self.response_size.observe(labels, size)
+
+    def render(self) -> str:
+        lines = []
+        for metric in (
+            self.requests,
+            self.duration,
+            self.db_time,
+            self.statements,
+            self.rows,
+            self.serialization,
+            self.response_size,
+        ):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if current_request.get() is not None:
+        context._metrics_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = current_request.get()
+    started = getattr(context, "_metrics_started", None)
+    if stats is None or started is None:
+        return
+    stats.db_seconds += time.perf_counter() - started
+    stats.statements += 1
+    # у серверного курсора (NDJSON) rowcount неизвестен — строки считает ndjson_response
+    if cursor.rowcount > 0:
+        stats.rows += cursor.rowcount
+
+
+def instrument_engine(engine: AsyncEngine):
+    event.listen(engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine.sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def server_timing(stats: RequestStats, elapsed: float) -> str:
+    # для потоковых ответов — время до первого байта, остальное видно только в метриках
+    return (
+        f'db;dur={stats.db_seconds * 1000:.1f};desc="{stats.statements} statements, {stats.rows} rows", '
+        f"ser;dur={stats.serialization_seconds * 1000:.1f}, "
+        f"total;dur={elapsed * 1000:.1f}"
+    )
+
+
+class MetricsMiddleware:
+    # чистый ASGI: BaseHTTPMiddleware дороже — тело ответа идёт через промежуточный поток в отдельной задаче
+    def __init__(self, app, server_timing_header: bool = True):
+        self.app = app
+        self.server_timing_header = server_timing_header
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = RequestStats()
+        token = current_request.set(stats)
+        started = time.perf_counter()
+        status = 500
+        size = 0
+
+        async def send_with_metrics(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.server_timing_header:
+                    timing = server_timing(stats, time.perf_counter() - started)
+                    message["headers"] = [*message.get("headers", ()), (b"server-timing", timing.encode())]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            current_request.reset(token)
+            # имя обработчика, как в route_statement_timeout_ms, а не путь: иначе число серий растёт с каждым id
+            route = getattr(scope.get("route"), "name", "unmatched")
+            metrics.observe(scope["method"], route, status, time.perf_counter() - started, stats, size)
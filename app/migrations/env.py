@@ -7,7 +7,8 @@ from app.models.models import (Building,
                                Organization, 
                                OrganizationPhone,
                                OrganizationActivity,
-                               Activity)
+                               Activity,
+                               ActivityClosure)
 from app.models.models import Base
 
 
@@ -0,0 +1,120 @@
+"""activity_closure
+
+Revision ID: 3f1c2a9d7b10
+Revises: 91cb07320987
+Create Date: 2026-10-18 12:10:41.512087
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f1c2a9d7b10'
+down_revision: Union[str, Sequence[str], None] = '91cb07320987'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('activity_closure',
+    sa.Column('ancestor_id', sa.Integer(), nullable=False),
+    sa.Column('descendant_id', sa.Integer(), nullable=False),
+    sa.Column('depth', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['ancestor_id'], ['activities.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['descendant_id'], ['activities.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('ancestor_id', 'descendant_id')
+    )
+    op.create_index('ix_activity_closure_descendant_id', 'activity_closure', ['descendant_id', 'ancestor_id'])
+
+    # полная пересборка замыкания, используется для первичного заполнения и массового импорта
+    op.execute("""
+        CREATE FUNCTION rebuild_activity_closure() RETURNS void AS $$
+        BEGIN
+            DELETE FROM activity_closure;
+            INSERT INTO activity_closure (ancestor_id, descendant_id, depth)
+            WITH RECURSIVE tree AS (
+                SELECT id AS ancestor_id, id AS descendant_id, 0 AS depth
+                FROM activities
+                UNION ALL
+                SELECT tree.ancestor_id, a.id, tree.depth + 1
+                FROM tree
+                JOIN activities a ON a.parent_id = tree.descendant_id
+            )
+            SELECT ancestor_id, descendant_id, depth FROM tree;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+
+    op.execute("""
+        CREATE FUNCTION activity_closure_insert() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO activity_closure (ancestor_id, descendant_id, depth)
+            SELECT NEW.id, NEW.id, 0
+            UNION ALL
+            SELECT c.ancestor_id, NEW.id, c.depth + 1
+            FROM activity_closure c
+            WHERE c.descendant_id = NEW.parent_id;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+
+    # перенос поддерева: отрываем его от старых предков и подвешиваем к новым
+    op.execute("""
+        CREATE FUNCTION activity_closure_move() RETURNS trigger AS $$
+        BEGIN
+            IF NEW.parent_id IS NOT NULL AND EXISTS (
+                SELECT 1 FROM activity_closure
+                WHERE ancestor_id = NEW.id AND descendant_id = NEW.parent_id
+            ) THEN
+                RAISE EXCEPTION 'activity % cannot be moved under its own descendant %', NEW.id, NEW.parent_id;
+            END IF;
+
+            DELETE FROM activity_closure c
+            USING activity_closure sub
+            WHERE sub.ancestor_id = NEW.id
+              AND c.descendant_id = sub.descendant_id
+              AND c.ancestor_id NOT IN (
+                  SELECT descendant_id FROM activity_closure WHERE ancestor_id = NEW.id
+              );
+
+            INSERT INTO activity_closure (ancestor_id, descendant_id, depth)
+            SELECT sup.ancestor_id, sub.descendant_id, sup.depth + sub.depth + 1
+            FROM activity_closure sup
+            CROSS JOIN activity_closure sub
+            WHERE sup.descendant_id = NEW.parent_id
+              AND sub.ancestor_id = NEW.id;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+
+    op.execute("""
+        CREATE TRIGGER activities_closure_insert
+        AFTER INSERT ON activities
+        FOR EACH ROW EXECUTE FUNCTION activity_closure_insert();
+    """)
+    op.execute("""
+        CREATE TRIGGER activities_closure_move
+        AFTER UPDATE OF parent_id ON activities
+        FOR EACH ROW
+        WHEN (OLD.parent_id IS DISTINCT FROM NEW.parent_id)
+        EXECUTE FUNCTION activity_closure_move();
+    """)
+
+    op.execute("SELECT rebuild_activity_closure()")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP TRIGGER activities_closure_move ON activities")
+    op.execute("DROP TRIGGER activities_closure_insert ON activities")
+    op.execute("DROP FUNCTION activity_closure_move()")
+    op.execute("DROP FUNCTION activity_closure_insert()")
+    op.execute("DROP FUNCTION rebuild_activity_closure()")
+    op.drop_index('ix_activity_closure_descendant_id', table_name='activity_closure')
+    op.drop_table('activity_closure')
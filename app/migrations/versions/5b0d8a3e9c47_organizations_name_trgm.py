@@ -0,0 +1,34 @@
+"""organizations_name_trgm
+
+Revision ID: 5b0d8a3e9c47
+Revises: e81b3c7f5a26
+Create Date: 2026-10-18 15:12:46.730158
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b0d8a3e9c47'
+down_revision: Union[str, Sequence[str], None] = 'e81b3c7f5a26'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    # триграммный индекс обслуживает ILIKE '%...%' и ранжирование по похожести
+    op.create_index(
+        'ix_organizations_name_trgm', 'organizations', ['name'],
+        postgresql_using='gin',
+        postgresql_ops={'name': 'gin_trgm_ops'},
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_organizations_name_trgm', table_name='organizations')
@@ -0,0 +1,60 @@
+"""missing_fk_indexes
+
+Revision ID: 6a8c0e2d4f91
+Revises: 9d2e4f7a1c35
+Create Date: 2026-10-18 18:26:53.204117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6a8c0e2d4f91'
+down_revision: Union[str, Sequence[str], None] = '9d2e4f7a1c35'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_organizations_building_id', 'organizations', ['building_id'])
+    op.create_index(
+        'ix_organization_phones_organization_id', 'organization_phones', ['organization_id', 'id']
+    )
+    op.create_index('ix_activities_parent_id', 'activities', ['parent_id'])
+    op.create_index('ix_activities_name_lower', 'activities', [sa.text('lower(name)')])
+    # перед уникальным ограничением убираем повторные привязки, оставляя самую раннюю
+    op.execute("""
+        DELETE FROM organization_activities AS duplicate
+        USING organization_activities AS original
+        WHERE duplicate.organization_id = original.organization_id
+          AND duplicate.activity_id = original.activity_id
+          AND duplicate.id > original.id
+    """)
+    op.create_unique_constraint(
+        'uq_organization_activities_organization_id_activity_id',
+        'organization_activities',
+        ['organization_id', 'activity_id'],
+    )
+    op.create_index(
+        'ix_organization_activities_activity_id',
+        'organization_activities',
+        ['activity_id', 'organization_id'],
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_organization_activities_activity_id', table_name='organization_activities')
+    op.drop_constraint(
+        'uq_organization_activities_organization_id_activity_id',
+        'organization_activities',
+        type_='unique',
+    )
+    op.drop_index('ix_activities_name_lower', table_name='activities')
+    op.drop_index('ix_activities_parent_id', table_name='activities')
+    op.drop_index('ix_organization_phones_organization_id', table_name='organization_phones')
+    op.drop_index('ix_organizations_building_id', table_name='organizations')
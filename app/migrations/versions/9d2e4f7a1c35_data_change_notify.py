@@ -0,0 +1,96 @@
+"""data_change_notify
+
+Revision ID: 9d2e4f7a1c35
+Revises: 5b0d8a3e9c47
+Create Date: 2026-10-18 17:41:09.518342
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9d2e4f7a1c35'
+down_revision: Union[str, Sequence[str], None] = '5b0d8a3e9c47'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+TABLES = (
+    'activities',
+    'buildings',
+    'organizations',
+    'organization_phones',
+    'organization_activities',
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # событие на каждую изменённую строку: таблица, операция, id строки и организации;
+    # для UPDATE, перенёсшего строку к другой организации, уведомляются обе
+    op.execute("""
+        CREATE OR REPLACE FUNCTION notify_data_change() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP <> 'INSERT' THEN
+                PERFORM pg_notify('data_changed', json_build_object(
+                    'table', TG_TABLE_NAME,
+                    'op', TG_OP,
+                    'id', OLD.id,
+                    'organization_id', CASE
+                        WHEN TG_TABLE_NAME = 'organizations' THEN OLD.id
+                        WHEN TG_TABLE_NAME IN ('organization_phones', 'organization_activities')
+                            THEN (to_jsonb(OLD) ->> 'organization_id')::integer
+                    END
+                )::text);
+            END IF;
+            IF TG_OP <> 'DELETE' THEN
+                PERFORM pg_notify('data_changed', json_build_object(
+                    'table', TG_TABLE_NAME,
+                    'op', TG_OP,
+                    'id', NEW.id,
+                    'organization_id', CASE
+                        WHEN TG_TABLE_NAME = 'organizations' THEN NEW.id
+                        WHEN TG_TABLE_NAME IN ('organization_phones', 'organization_activities')
+                            THEN (to_jsonb(NEW) ->> 'organization_id')::integer
+                    END
+                )::text);
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+    # TRUNCATE затрагивает всю таблицу — слушатель перезагружает всё
+    op.execute("""
+        CREATE OR REPLACE FUNCTION notify_data_truncate() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('data_changed', json_build_object(
+                'table', TG_TABLE_NAME,
+                'op', TG_OP
+            )::text);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+    for table in TABLES:
+        op.execute(f"""
+            CREATE TRIGGER {table}_notify_change
+            AFTER INSERT OR UPDATE OR DELETE ON {table}
+            FOR EACH ROW EXECUTE FUNCTION notify_data_change();
+        """)
+        op.execute(f"""
+            CREATE TRIGGER {table}_notify_truncate
+            AFTER TRUNCATE ON {table}
+            FOR EACH STATEMENT EXECUTE FUNCTION notify_data_truncate();
+        """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table in TABLES:
+        op.execute(f"DROP TRIGGER {table}_notify_truncate ON {table}")
+        op.execute(f"DROP TRIGGER {table}_notify_change ON {table}")
+    op.execute("DROP FUNCTION notify_data_truncate()")
+    op.execute("DROP FUNCTION notify_data_change()")
@@ -0,0 +1,28 @@
+"""buildings_coordinates_index
+
+Revision ID: a7d4e61b2c93
+Revises: 3f1c2a9d7b10
+Create Date: 2026-10-18 13:02:17.884310
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7d4e61b2c93'
+down_revision: Union[str, Sequence[str], None] = '3f1c2a9d7b10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_buildings_latitude_longitude', 'buildings', ['latitude', 'longitude'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_buildings_latitude_longitude', table_name='buildings')
@@ -0,0 +1,34 @@
+"""buildings_earth_knn_index
+
+Revision ID: c52e9f0a4d18
+Revises: a7d4e61b2c93
+Create Date: 2026-10-18 13:47:55.102664
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c52e9f0a4d18'
+down_revision: Union[str, Sequence[str], None] = 'a7d4e61b2c93'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("CREATE EXTENSION IF NOT EXISTS cube")
+    op.execute("CREATE EXTENSION IF NOT EXISTS earthdistance")
+    # GiST по точке на сфере: поиск ближайших соседей через оператор <->
+    op.execute(
+        "CREATE INDEX ix_buildings_earth ON buildings "
+        "USING gist (ll_to_earth(latitude, longitude))"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP INDEX ix_buildings_earth")
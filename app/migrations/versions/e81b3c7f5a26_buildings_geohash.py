@@ -0,0 +1,86 @@
+"""buildings_geohash
+
+Revision ID: e81b3c7f5a26
+Revises: c52e9f0a4d18
+Create Date: 2026-10-18 14:31:08.419925
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e81b3c7f5a26'
+down_revision: Union[str, Sequence[str], None] = 'c52e9f0a4d18'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("""
+        CREATE FUNCTION geohash_encode(lat double precision, lon double precision, hash_length integer)
+        RETURNS text AS $$
+        DECLARE
+            base32 constant text := '0123456789bcdefghjkmnpqrstuvwxyz';
+            lat_lo double precision := -90;
+            lat_hi double precision := 90;
+            lon_lo double precision := -180;
+            lon_hi double precision := 180;
+            mid double precision;
+            hash text := '';
+            bits integer := 0;
+            ch integer := 0;
+            even boolean := true;
+        BEGIN
+            WHILE length(hash) < hash_length LOOP
+                IF even THEN
+                    mid := (lon_lo + lon_hi) / 2;
+                    IF lon >= mid THEN
+                        ch := ch * 2 + 1;
+                        lon_lo := mid;
+                    ELSE
+                        ch := ch * 2;
+                        lon_hi := mid;
+                    END IF;
+                ELSE
+                    mid := (lat_lo + lat_hi) / 2;
+                    IF lat >= mid THEN
+                        ch := ch * 2 + 1;
+                        lat_lo := mid;
+                    ELSE
+                        ch := ch * 2;
+                        lat_hi := mid;
+                    END IF;
+                END IF;
+                even := NOT even;
+                bits := bits + 1;
+                IF bits = 5 THEN
+                    hash := hash || substr(base32, ch + 1, 1);
+                    bits := 0;
+                    ch := 0;
+                END IF;
+            END LOOP;
+            RETURN hash;
+        END;
+        $$ LANGUAGE plpgsql IMMUTABLE STRICT PARALLEL SAFE;
+    """)
+    op.add_column('buildings', sa.Column(
+        'geohash',
+        sa.String(length=12),
+        sa.Computed('geohash_encode(latitude, longitude, 12)', persisted=True),
+        nullable=False,
+    ))
+    op.create_index(
+        'ix_buildings_geohash', 'buildings', ['geohash'],
+        postgresql_ops={'geohash': 'text_pattern_ops'},
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_buildings_geohash', table_name='buildings')
+    op.drop_column('buildings', 'geohash')
+    op.execute("DROP FUNCTION geohash_encode(double precision, double precision, integer)")
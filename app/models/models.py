@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Float
+from sqlalchemy import Column, Integer, String, ForeignKey, Float, Index, Computed, UniqueConstraint, func
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
 
@@ -11,7 +11,18 @@ class Building(Base):
     address = Column(String, nullable=False)
     latitude = Column(Float, nullable=False)
     longitude = Column(Float, nullable=False)
+    # geohash точности 12, вычисляется в БД; ячейка точности p — первые p символов
+    geohash = Column(String(12), Computed("geohash_encode(latitude, longitude, 12)", persisted=True), nullable=False)
     organizations = relationship("Organization", back_populates="building")
+    __table_args__ = (
+        Index("ix_buildings_latitude_longitude", "latitude", "longitude"),
+        Index(
+            "ix_buildings_earth",
+            func.ll_to_earth(latitude, longitude),
+            postgresql_using="gist",
+        ),
+        Index("ix_buildings_geohash", "geohash", postgresql_ops={"geohash": "text_pattern_ops"}),
+    )
 
 
 class Organization(Base):
@@ -22,6 +33,15 @@ class Organization(Base):
     building = relationship("Building", back_populates="organizations")
     phones = relationship("OrganizationPhone", back_populates="organization", cascade="all, delete-orphan")
     activities = relationship("OrganizationActivity", back_populates="organization", cascade="all, delete-orphan")
+    __table_args__ = (
+        Index(
+            "ix_organizations_name_trgm",
+            "name",
+            postgresql_using="gin",
+            postgresql_ops={"name": "gin_trgm_ops"},
+        ),
+        Index("ix_organizations_building_id", "building_id"),
+    )
     @property
     def activity_list(self):
         return [oa.activity for oa in self.activities]
@@ -32,6 +52,10 @@ class OrganizationPhone(Base):
     phone_number = Column(String, nullable=False)
     organization_id = Column(Integer, ForeignKey("organizations.id"), nullable=False)
     organization = relationship("Organization", back_populates="phones")
+    __table_args__ = (
+        # телефоны организации в порядке id без отдельной сортировки
+        Index("ix_organization_phones_organization_id", "organization_id", "id"),
+    )
 
 
 class Activity(Base):
@@ -40,6 +64,21 @@ class Activity(Base):
     name = Column(String, nullable=False)
     parent_id = Column(Integer, ForeignKey("activities.id"), nullable=True)
     parent = relationship("Activity", remote_side=[id], backref="children")
+    __table_args__ = (
+        Index("ix_activities_parent_id", "parent_id"),
+        Index("ix_activities_name_lower", func.lower(name)),
+    )
+
+
+class ActivityClosure(Base):
+    # предвычисленное отношение предок-потомок, поддерживается триггерами на activities
+    __tablename__ = "activity_closure"
+    ancestor_id = Column(Integer, ForeignKey("activities.id", ondelete="CASCADE"), primary_key=True)
+    descendant_id = Column(Integer, ForeignKey("activities.id", ondelete="CASCADE"), primary_key=True)
+    depth = Column(Integer, nullable=False)
+    __table_args__ = (
+        Index("ix_activity_closure_descendant_id", "descendant_id", "ancestor_id"),
+    )
 
 
 class OrganizationActivity(Base):
@@ -49,3 +88,8 @@ class OrganizationActivity(Base):
     activity_id = Column(Integer, ForeignKey("activities.id"), nullable=False)
     organization = relationship("Organization", back_populates="activities")
     activity = relationship("Activity")
+    __table_args__ = (
+        UniqueConstraint("organization_id", "activity_id", name="uq_organization_activities_organization_id_activity_id"),
+        # обратное направление: организации по виду деятельности
+        Index("ix_organization_activities_activity_id", "activity_id", "organization_id"),
+    )
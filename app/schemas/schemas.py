@@ -1,6 +1,5 @@
-from pydantic import BaseModel, ConfigDict
-from typing import List, Optional
-from app.models import models
+from pydantic import BaseModel, ConfigDict, Field
+from typing import List, Literal, Optional
 
 
 class BuildingOut(BaseModel):
@@ -29,32 +28,40 @@ class OrganizationPhoneOut(BaseModel):
 
 
 class OrganizationOut(BaseModel):
+    # при fields/expand в ответе есть только запрошенные поля
     id: int
-    name: str
-    building: BuildingOut
-    phones: List[OrganizationPhoneOut]
-    activities: List[ActivityOut]
+    name: Optional[str] = None
+    building: Optional[BuildingOut] = None
+    phones: Optional[List[OrganizationPhoneOut]] = None
+    activities: Optional[List[ActivityOut]] = None
 
     model_config = ConfigDict(from_attributes=True)
-    
 
 
-ActivityOut.model_rebuild()
+class OrganizationNearOut(OrganizationOut):
+    distance_km: float
+
+
+class OrganizationBatchIn(BaseModel):
+    ids: List[int] = Field(..., min_length=1, max_length=500)
+
+
+class OrganizationBatchOut(BaseModel):
+    items: List[OrganizationOut]
+    missing: List[int]
+
+
+class SuggestionOut(BaseModel):
+    kind: Literal["organization", "activity"]
+    id: int
+    name: str
+
+
+class GeoClusterOut(BaseModel):
+    geohash: str
+    count: int
+    latitude: float
+    longitude: float
 
-def serialize_activity(activity: models.Activity, level: int = 1, max_level: int = 3) -> ActivityOut:
-    if level > max_level:
-        return None
-    try:
-        children = getattr(activity, "children", []) or []
-    except Exception:
-        children = []
-    return ActivityOut(
-        id=activity.id,
-        name=activity.name,
-        parent_id=activity.parent_id,
-        children=[
-            child_out
-            for child in children
-            if (child_out := serialize_activity(child, level + 1, max_level)) is not None
-        ] if level < max_level else None
-    )
\ No newline at end of file
+
+ActivityOut.model_rebuild()
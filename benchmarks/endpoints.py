@@ -0,0 +1,257 @@
+"""Нагрузочный прогон всех эндпоинтов app/api/v1/routers.py внутри процесса,
+через ASGI без сети и HTTP-клиента. Для каждого маршрута и уровня параллельности —
+прогрев, затем замер: p50/p95/p99, запросов в секунду, SQL-запросов на запрос
+и пиковый RSS процесса. Результат в JSON, чтобы прогоны можно было сравнивать.
+Данные — из benchmarks.synthetic_data; кэш ответов по умолчанию выключен,
+чтобы мерить путь до БД, а не словарь в памяти.
+
+    python -m benchmarks.synthetic_data --scale small
+    python -m benchmarks.endpoints --concurrency 1,8,32 --requests 500 --output small.json
+    python -m benchmarks.endpoints --routes by_id,batch --cache
+"""
+import argparse
+import asyncio
+import json
+import math
+import resource
+import sys
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import urlencode
+
+import orjson
+from sqlalchemy import event, text
+
+from app.api.v1.streaming import NDJSON_MEDIA_TYPE
+from app.config import settings
+from app.db.database import async_session_factory, engine, replicas, timeout_engines
+from app.main import app
+from benchmarks.synthetic_data import sample_arguments
+
+
+class Call(NamedTuple):
+    method: str
+    path: str
+    query: List[Tuple[str, object]]
+    body: Optional[dict] = None
+    accept: str = "application/json"
+
+
+def calls(a: dict) -> Dict[str, Call]:
+    base = settings.api.prefix + settings.api.v1.prefix + settings.api.v1.organizations
+    box = [
+        ("lat_min", a["lat"] - 0.01), ("lat_max", a["lat"] + 0.01),
+        ("lon_min", a["lon"] - 0.02), ("lon_max", a["lon"] + 0.02),
+    ]
+    radius = [("lat", a["lat"]), ("lon", a["lon"]), ("radius_km", 0.5)]
+    return {
+        "building": Call("GET", f"{base}/building/{a['building_id']}", []),
+        "building_ndjson": Call("GET", f"{base}/building/{a['building_id']}", [], accept=NDJSON_MEDIA_TYPE),
+        "by_activity": Call("GET", f"{base}/by-activity", [("name", a["activity_name"])]),
+        "search_activity": Call("GET", f"{base}/search-activity", [("name", a["root_name"])]),
+        "by_activities": Call("GET", f"{base}/by-activities", [
+            ("any_of", a["root_name"]), ("all_of", a["activity_name"]),
+        ]),
+        "search_by_name": Call("GET", f"{base}/search-by-name", [("name", a["name"])]),
+        "search": Call("GET", f"{base}/search", [("activity", a["root_name"]), *radius]),
+        "geo_radius": Call("GET", f"{base}/geo-search", radius),
+        "geo_rectangle": Call("GET", f"{base}/geo-search", box),
+        "geo_nearest": Call("GET", f"{base}/geo-nearest", [("lat", a["lat"]), ("lon", a["lon"])]),
+        "geo_clusters": Call("GET", f"{base}/geo-clusters", [*box, ("precision", 6)]),
+        "autocomplete": Call("GET", f"{base}/autocomplete", [("q", a["name"][:3])]),
+        "batch": Call("POST", f"{base}/batch", [], body={"ids": list(range(a["org_id"], a["org_id"] + 50))}),
+        "by_id": Call("GET", f"{base}/{a['org_id']}", []),
+    }
+
+
+async def request(call: Call) -> Tuple[int, int]:
+    # минимальный ASGI-клиент: одно тело запроса, ответ собирается целиком
+    body = orjson.dumps(call.body) if call.body is not None else b""
+    headers = [
+        (b"host", b"benchmark"),
+        (b"accept", call.accept.encode()),
+        (b"x-api-key", settings.secret.key.encode()),
+    ]
+    if call.body is not None:
+        headers += [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": call.method,
+        "scheme": "http",
+        "path": call.path,
+        "raw_path": call.path.encode(),
+        "query_string": urlencode(call.query).encode(),
+        "root_path": "",
+        "headers": headers,
+        "client": ("127.0.0.1", 0),
+        "server": ("benchmark", 80),
+    }
+    done = asyncio.Event()
+    sent = False
+    status = 0
+    size = 0
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        # отключение клиента — только после того, как ответ полностью отдан
+        await done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status, size
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            size += len(message.get("body", b""))
+            if not message.get("more_body", False):
+                done.set()
+
+    try:
+        # своя задача — своя копия контекста, как у сервера: ContextVar, выставленные
+        # зависимостями запроса, не переходят в следующий запрос того же воркера
+        await asyncio.create_task(app(scope, receive, send))
+    except Exception:
+        # ServerErrorMiddleware уже ответил 500 и пробрасывает исключение дальше, как для сервера;
+        # например, на локальной БД без pg_trgm или earthdistance
+        status = status or 500
+    return status, size
+
+
+def percentile(values: List[float], p: float) -> float:
+    # метод ближайшего ранга
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss в Linux — в килобайтах, в macOS — в байтах
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+    def attach(self):
+        for target in [engine, *replicas.engines, *timeout_engines()]:
+            event.listen(target.sync_engine, "before_cursor_execute", self)
+
+    def detach(self):
+        for target in [engine, *replicas.engines, *timeout_engines()]:
+            event.remove(target.sync_engine, "before_cursor_execute", self)
+
+
+async def measure(call: Call, total: int, concurrency: int, queries: QueryCounter) -> dict:
+    latencies: List[float] = []
+    statuses: Dict[int, int] = {}
+    remaining = total
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            started = time.perf_counter()
+            status, _ = await request(call)
+            latencies.append((time.perf_counter() - started) * 1000)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    queries.count = 0
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": total,
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "rps": round(total / elapsed, 1),
+        "queries_per_request": round(queries.count / total, 2),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+async def activity_names(a: dict) -> dict:
+    async with async_session_factory() as db:
+        rows = (await db.execute(
+            text("SELECT id, name FROM activities WHERE id IN (:activity_id, :root_id)"),
+            {"activity_id": a["activity_id"], "root_id": a["root_id"]},
+        )).all()
+    names = dict(rows)
+    return {**a, "activity_name": names[a["activity_id"]], "root_name": names[a["root_id"]]}
+
+
+async def run(args) -> dict:
+    # прогон не должен зависеть от уведомлений других процессов
+    settings.indexes.listen_for_changes = False
+    settings.cache.enabled = args.cache
+    report = {
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {
+            "requests": args.requests,
+            "warmup": args.warmup,
+            "cache": args.cache,
+            "pool_size": settings.db.pool_size,
+            "replicas": len(settings.db.replica_urls),
+        },
+    }
+    async with app.router.lifespan_context(app):
+        async with async_session_factory() as db:
+            arguments = await sample_arguments(db)
+        arguments = await activity_names(arguments)
+        report["arguments"] = arguments
+        selected = calls(arguments)
+        if args.routes:
+            selected = {label: selected[label] for label in args.routes.split(",")}
+
+        queries = QueryCounter()
+        queries.attach()
+        results = {}
+        try:
+            for label, call in selected.items():
+                for _ in range(args.warmup):
+                    await request(call)
+                results[label] = {
+                    str(concurrency): await measure(call, args.requests, concurrency, queries)
+                    for concurrency in args.concurrency
+                }
+                print(label, json.dumps(results[label], ensure_ascii=False), file=sys.stderr)
+        finally:
+            queries.detach()
+        report["results"] = results
+    report["peak_rss_mb"] = peak_rss_mb()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200, help="замеряемых запросов на маршрут и уровень")
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument(
+        "--concurrency",
+        type=lambda value: [int(level) for level in value.split(",")],
+        default=[1, 8, 32],
+    )
+    parser.add_argument("--routes", default=None, help="через запятую, по умолчанию все")
+    parser.add_argument("--cache", action="store_true", help="не выключать кэш ответов")
+    parser.add_argument("--output", default=None, help="файл для JSON, по умолчанию stdout")
+    args = parser.parse_args()
+    report = json.dumps(asyncio.run(run(args)), indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w") as output:
+            output.write(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
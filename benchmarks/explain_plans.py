@@ -0,0 +1,159 @@
+"""Регрессия планов: выполняет запросы org_crud на текущей БД, перехватывает
+отправленный SQL, прогоняет его через EXPLAIN и завершается с кодом 1, если
+в каком-то плане есть Seq Scan по таблицам данных. Смысл имеет на большом
+наборе данных (см. benchmarks.synthetic_data): на маленьких таблицах
+последовательное чтение дешевле индекса и будет выбрано честно.
+
+    python -m benchmarks.synthetic_data --organizations 100000
+    python -m benchmarks.explain_plans
+"""
+import argparse
+import asyncio
+import json
+import sys
+from typing import AsyncIterator, Iterator, List, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.exc import DBAPIError
+
+from app.db.crud import organization as org_crud
+from app.db.database import async_session_factory, engine, replicas, statement_timeout_ms, timeout_engine
+from app.models import models
+from app.indexes.activity_orgs import activity_org_index
+from app.indexes.activity_tree import activity_tree
+from benchmarks.synthetic_data import sample_arguments
+
+
+TABLES = {
+    "activities",
+    "activity_closure",
+    "buildings",
+    "organizations",
+    "organization_phones",
+    "organization_activities",
+}
+
+# коды ошибок PostgreSQL undefined_function и undefined_object: нет расширения pg_trgm
+# или earthdistance. Такой запрос пропускается, любая другая ошибка — падение прогона
+MISSING_EXTENSION = {"42883", "42704"}
+
+
+def seq_scans(plan: dict) -> Iterator[str]:
+    if plan.get("Node Type") == "Seq Scan" and plan.get("Relation Name") in TABLES:
+        yield plan["Relation Name"]
+    for child in plan.get("Plans", ()):
+        yield from seq_scans(child)
+
+
+async def drain(batches: AsyncIterator[list]):
+    # NDJSON-ответ: запрос уходит через серверный курсор на сессии read_session
+    async for _ in batches:
+        pass
+
+
+def cases(a: dict) -> List[Tuple[str, callable]]:
+    shape = org_crud.CardShape()
+    box = (a["lat"] - 0.01, a["lat"] + 0.01, a["lon"] - 0.02, a["lon"] + 0.02)
+    return [
+        ("get_by_building", lambda db: org_crud.get_by_building(db, a["building_id"], 50, shape)),
+        ("get_by_activity_tree", lambda db: org_crud.get_by_activity_tree(db, a["root_id"], 50, shape)),
+        ("get_by_activity_only", lambda db: org_crud.get_by_activity_only(db, a["activity_id"], 50, shape)),
+        ("get_by_activities", lambda db: org_crud.get_by_activities(db, [a["root_id"]], [a["activity_id"]], 50, shape)),
+        ("get_by_id", lambda db: org_crud.get_by_id(db, a["org_id"], shape)),
+        ("get_by_ids", lambda db: org_crud.get_by_ids(db, [a["org_id"], a["org_id"] + 1, a["org_id"] + 2], shape)),
+        ("get_by_radius", lambda db: org_crud.get_by_radius(db, a["lat"], a["lon"], 0.5, 50, shape)),
+        ("get_by_rectangle", lambda db: org_crud.get_by_rectangle(db, *box, 50, shape)),
+        ("get_clusters", lambda db: org_crud.get_clusters(db, *box, 6)),
+        ("search_combined", lambda db: org_crud.search_combined(
+            db, 50, shape, activity_id=a["root_id"], building_id=a["building_id"],
+        )),
+        # NDJSON: без страницы, весь результат в порядке сортировки
+        ("stream_building", lambda db: drain(org_crud.stream_organizations(
+            org_crud.building_orgs(a["building_id"]), shape,
+        ))),
+        ("stream_activity_orgs", lambda db: drain(org_crud.stream_organizations(
+            org_crud.activity_orgs(a["activity_id"]), shape,
+        ))),
+        ("stream_activity_tree_orgs", lambda db: drain(org_crud.stream_organizations(
+            org_crud.activity_tree_orgs(a["root_id"]), shape,
+        ))),
+        ("stream_radius", lambda db: drain(org_crud.stream_organizations(
+            org_crud.radius_orgs(a["lat"], a["lon"], 0.5), shape,
+        ))),
+        ("stream_rectangle", lambda db: drain(org_crud.stream_organizations(org_crud.rectangle_orgs(*box), shape))),
+        ("stream_combined", lambda db: drain(org_crud.stream_organizations(
+            org_crud.combined_orgs(activity_id=a["root_id"], building_id=a["building_id"]), shape,
+        ))),
+        # требуют pg_trgm и earthdistance
+        ("search_by_name", lambda db: org_crud.search_by_name(db, a["name"], 50, shape)),
+        ("stream_by_name", lambda db: drain(org_crud.stream_organizations(
+            org_crud.name_orgs(a["name"]),
+            shape,
+            order_by=[org_crud.name_rank(a["name"]).desc(), models.Organization.id],
+        ))),
+        ("get_nearest", lambda db: org_crud.get_nearest(db, a["lat"], a["lon"], 20, shape)),
+    ]
+
+
+async def run() -> dict:
+    captured: List[Tuple[str, tuple]] = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            captured.append((statement, parameters))
+
+    # без индексов запросы бывают дольше statement_timeout API; план важнее времени
+    statement_timeout_ms.set(0)
+    report = {}
+    async with async_session_factory() as db:
+        await activity_tree.load(db)
+        await activity_org_index.load(db)
+        arguments = await sample_arguments(db)
+    report["arguments"] = arguments
+
+    # NDJSON читается с реплики, если она настроена; EXPLAIN — всегда на основном сервере
+    # с отключённым statement_timeout запросы идут через отдельные движки
+    engines = [timeout_engine(target, 0) for target in [engine, *replicas.engines]]
+    for target in engines:
+        event.listen(target.sync_engine, "before_cursor_execute", capture)
+    results = {}
+    for label, call in cases(arguments):
+        captured.clear()
+        async with async_session_factory() as db:
+            try:
+                await call(db)
+            except DBAPIError as exc:
+                if getattr(exc.orig, "sqlstate", None) not in MISSING_EXTENSION:
+                    raise
+                results[label] = {"skipped": str(exc.orig).splitlines()[0]}
+                continue
+        statements = list(captured)
+        found = []
+        async with engine.connect() as conn:
+            for statement, parameters in statements:
+                plan = (await conn.exec_driver_sql("EXPLAIN (FORMAT JSON) " + statement, parameters)).scalar()
+                plan = plan if isinstance(plan, list) else json.loads(plan)
+                found.extend(seq_scans(plan[0]["Plan"]))
+        results[label] = {"statements": len(statements), "seq_scans": sorted(set(found))}
+    for target in engines:
+        event.remove(target.sync_engine, "before_cursor_execute", capture)
+    await replicas.dispose()
+    for target in engines:
+        await target.dispose()
+    await engine.dispose()
+    report["results"] = results
+    return report
+
+
+def main():
+    argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter).parse_args()
+    report = asyncio.run(run())
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    failed = [label for label, result in report["results"].items() if result.get("seq_scans")]
+    if failed:
+        print("Seq Scan в планах: " + ", ".join(failed), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""CPU на сериализацию 1000 карточек организаций: прежний путь через pydantic
+(ручная сборка OrganizationOut + повторная валидация по response_model) против
+словарей, которые сразу уходят в orjson (поддеревья видов деятельности — из кэша дерева).
+
+    python -m benchmarks.serialization --organizations 1000 --repeat 50
+"""
+import argparse
+import json
+import random
+import time
+from collections import namedtuple
+from typing import List
+
+import orjson
+from pydantic import TypeAdapter
+
+from app.db.crud.organization import CardShape, org_card
+from app.indexes.activity_tree import activity_tree
+from app.models import models
+from app.schemas.schemas import ActivityOut, OrganizationOut
+
+
+def build_organizations(count: int, seed: int = 0) -> List[models.Organization]:
+    rnd = random.Random(seed)
+    activities = []
+    next_id = 1
+    for _ in range(5):
+        root = models.Activity(id=next_id, name=f"Вид {next_id}", parent_id=None)
+        activities.append(root)
+        next_id += 1
+        for _ in range(4):
+            child = models.Activity(id=next_id, name=f"Вид {next_id}", parent_id=root.id, parent=root)
+            activities.append(child)
+            next_id += 1
+            for _ in range(3):
+                activities.append(
+                    models.Activity(id=next_id, name=f"Вид {next_id}", parent_id=child.id, parent=child)
+                )
+                next_id += 1
+
+    activity_tree.build((a.id, a.name, a.parent_id) for a in activities)
+
+    organizations = []
+    for org_id in range(1, count + 1):
+        building = models.Building(
+            id=org_id,
+            address=f"г. Москва, ул. Тестовая {org_id}",
+            latitude=55.7 + rnd.random() / 10,
+            longitude=37.6 + rnd.random() / 10,
+        )
+        org = models.Organization(id=org_id, name=f"ООО Организация {org_id}", building=building)
+        org.phones = [
+            models.OrganizationPhone(id=org_id * 2 + i, phone_number=f"8-800-{org_id:06d}-{i}")
+            for i in range(2)
+        ]
+        org.activities = [
+            models.OrganizationActivity(id=org_id * 2 + i, activity_id=activity.id, activity=activity)
+            for i, activity in enumerate(rnd.sample(activities, 2))
+        ]
+        organizations.append(org)
+    return organizations
+
+
+def _pydantic_activity(activity: models.Activity, level: int = 1, max_level: int = 3):
+    # прежняя реализация serialize_activity
+    if level > max_level:
+        return None
+    children = getattr(activity, "children", []) or []
+    return ActivityOut(
+        id=activity.id,
+        name=activity.name,
+        parent_id=activity.parent_id,
+        children=[
+            child_out
+            for child in children
+            if (child_out := _pydantic_activity(child, level + 1, max_level)) is not None
+        ] if level < max_level else None
+    )
+
+
+_response_adapter = TypeAdapter(List[OrganizationOut])
+
+
+def pydantic_path(organizations: List[models.Organization]) -> bytes:
+    content = [
+        OrganizationOut(
+            id=org.id,
+            name=org.name,
+            building=org.building,
+            phones=org.phones,
+            activities=[_pydantic_activity(oa.activity) for oa in org.activities],
+        )
+        for org in organizations
+    ]
+    # то, что FastAPI делает с ответом при response_model
+    validated = _response_adapter.validate_python(content, from_attributes=True)
+    return orjson.dumps(_response_adapter.dump_python(validated, mode="json"))
+
+
+# строка результата единого запроса карточек: колонки _card_select при всех полях CardShape
+CardRow = namedtuple(
+    "CardRow",
+    "id name building_id address latitude longitude phones activity_ids",
+)
+
+
+def card_rows(organizations: List[models.Organization]) -> List[CardRow]:
+    return [
+        CardRow(
+            org.id,
+            org.name,
+            org.building.id,
+            org.building.address,
+            org.building.latitude,
+            org.building.longitude,
+            [{"id": phone.id, "phone_number": phone.phone_number} for phone in org.phones],
+            [oa.activity_id for oa in org.activities],
+        )
+        for org in organizations
+    ]
+
+
+def orjson_path(rows: List[CardRow]) -> bytes:
+    return orjson.dumps([org_card(row, CardShape(depth=3)) for row in rows])
+
+
+def measure(fn, organizations, repeat: int) -> float:
+    fn(organizations)
+    started = time.process_time()
+    for _ in range(repeat):
+        fn(organizations)
+    return (time.process_time() - started) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--organizations", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    organizations = build_organizations(args.organizations)
+    rows = card_rows(organizations)
+    assert orjson.loads(pydantic_path(organizations)) == orjson.loads(orjson_path(rows))
+
+    per_thousand = 1000 / args.organizations
+    pydantic_ms = measure(pydantic_path, organizations, args.repeat) * 1000 * per_thousand
+    orjson_ms = measure(orjson_path, rows, args.repeat) * 1000 * per_thousand
+    print(json.dumps({
+        "organizations": args.organizations,
+        "repeat": args.repeat,
+        "pydantic_cpu_ms_per_1000": round(pydantic_ms, 3),
+        "orjson_cpu_ms_per_1000": round(orjson_ms, 3),
+        "speedup": round(pydantic_ms / orjson_ms, 2) if orjson_ms else None,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
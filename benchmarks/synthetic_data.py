@@ -0,0 +1,209 @@
+"""Синтетические данные для проверок планов и нагрузочных прогонов: здания
+кластерами вокруг нескольких центров в пределах Москвы, дерево видов деятельности
+заданной ширины и глубины, организации с телефонами и несколькими видами
+деятельности. Генерация — в БД через generate_series, таблицы должны быть пустыми.
+
+    python -m benchmarks.synthetic_data --scale medium
+    python -m benchmarks.synthetic_data --organizations 250000 --activity-depth 5 --activity-branching 3
+"""
+import argparse
+import asyncio
+import json
+import random
+from typing import List
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from app.db.database import engine
+
+
+# число организаций по размеру набора
+SCALES = {
+    "small": 10_000,
+    "medium": 100_000,
+    "large": 1_000_000,
+    "xl": 10_000_000,
+}
+
+# прямоугольник, в котором лежат центры кластеров
+LAT_RANGE = (55.55, 55.95)
+LON_RANGE = (37.35, 37.90)
+
+# на этих таблицах пользовательские триггеры только уведомляют об изменениях (NOTIFY);
+# на время массовой вставки они отключаются, а слушателям уходит одно событие полной перезагрузки
+NOTIFY_TABLES = ("buildings", "organizations", "organization_phones", "organization_activities")
+
+
+def activity_tree_rows(roots: int, branching: int, depth: int) -> List[dict]:
+    # уровень за уровнем: родители всегда раньше детей — этого ждёт триггер closure-таблицы
+    rows = []
+    level = []
+    for _ in range(roots):
+        activity_id = len(rows) + 1
+        rows.append({"id": activity_id, "name": f"Вид {activity_id}", "parent_id": None})
+        level.append(activity_id)
+    for _ in range(depth - 1):
+        next_level = []
+        for parent_id in level:
+            for _ in range(branching):
+                activity_id = len(rows) + 1
+                rows.append({"id": activity_id, "name": f"Вид {activity_id}", "parent_id": parent_id})
+                next_level.append(activity_id)
+        level = next_level
+    return rows
+
+
+async def generate(
+    conn: AsyncConnection,
+    organizations: int,
+    buildings: int,
+    roots: int = 8,
+    branching: int = 5,
+    depth: int = 3,
+    clusters: int = 12,
+    cluster_spread: float = 0.02,
+    phones_per_organization: int = 2,
+    activities_per_organization: int = 3,
+    seed: int = 0,
+) -> dict:
+    # массовая вставка дольше statement_timeout, заданного для запросов API
+    await conn.execute(text("SET LOCAL statement_timeout = 0"))
+    existing = (await conn.execute(text("SELECT count(*) FROM organizations"))).scalar()
+    if existing:
+        raise SystemExit(f"В organizations уже {existing} строк, нужна пустая БД")
+
+    activities = activity_tree_rows(roots, branching, depth)
+    await conn.execute(
+        text("INSERT INTO activities (id, name, parent_id) VALUES (:id, :name, :parent_id)"),
+        activities,
+    )
+
+    for table in NOTIFY_TABLES:
+        await conn.execute(text(f"ALTER TABLE {table} DISABLE TRIGGER USER"))
+
+    rnd = random.Random(seed)
+    await conn.execute(text("SELECT setseed(:seed)"), {"seed": rnd.random()})
+    # кластер выбирается случайно, разброс вокруг центра нормальный (преобразование Бокса — Мюллера)
+    await conn.execute(text("""
+        INSERT INTO buildings (id, address, latitude, longitude)
+        SELECT g,
+               'г. Москва, ул. Синтетическая ' || g,
+               lats[c] + spread * sqrt(-2 * ln(1 - random())) * cos(2 * pi() * random()),
+               lons[c] + spread * 1.8 * sqrt(-2 * ln(1 - random())) * cos(2 * pi() * random())
+        FROM (
+            SELECT g,
+                   1 + floor(random() * cardinality(CAST(:lats AS float8[])))::int AS c,
+                   CAST(:lats AS float8[]) AS lats,
+                   CAST(:lons AS float8[]) AS lons,
+                   CAST(:spread AS float8) AS spread
+            FROM generate_series(1, CAST(:buildings AS integer)) AS g
+        ) AS picked
+    """), {
+        "buildings": buildings,
+        "spread": cluster_spread,
+        "lats": [rnd.uniform(*LAT_RANGE) for _ in range(clusters)],
+        "lons": [rnd.uniform(*LON_RANGE) for _ in range(clusters)],
+    })
+    await conn.execute(text("""
+        INSERT INTO organizations (id, name, building_id)
+        SELECT g,
+               (ARRAY['ООО', 'ЗАО', 'ИП', 'АО'])[1 + floor(random() * 4)::int]
+                   || ' ' || (ARRAY['Рога', 'Копыта', 'Молоко', 'Мясной', 'Лес', 'Двор', 'Сыр', 'Хлеб'])[1 + floor(random() * 8)::int]
+                   || ' ' || g,
+               1 + floor(random() * CAST(:buildings AS integer))::int
+        FROM generate_series(1, CAST(:organizations AS integer)) AS g
+    """), {"organizations": organizations, "buildings": buildings})
+    await conn.execute(text("""
+        INSERT INTO organization_phones (id, organization_id, phone_number)
+        SELECT g, 1 + (g - 1) / CAST(:per_org AS integer), '8-9' || lpad((floor(random() * 1e9))::bigint::text, 9, '0')
+        FROM generate_series(1, CAST(:organizations AS integer) * CAST(:per_org AS integer)) AS g
+    """), {"organizations": organizations, "per_org": phones_per_organization})
+    await conn.execute(text("""
+        INSERT INTO organization_activities (organization_id, activity_id)
+        SELECT DISTINCT o, 1 + floor(random() * CAST(:activities AS integer))::int
+        FROM generate_series(1, CAST(:organizations AS integer)) AS o, generate_series(1, CAST(:per_org AS integer)) AS k
+    """), {"organizations": organizations, "per_org": activities_per_organization, "activities": len(activities)})
+
+    for table in NOTIFY_TABLES:
+        await conn.execute(text(f"ALTER TABLE {table} ENABLE TRIGGER USER"))
+    await conn.execute(text("""SELECT pg_notify('data_changed', '{"table": "organizations", "op": "TRUNCATE"}')"""))
+
+    # id заданы явно — сдвигаем последовательности
+    for table in ("activities", "buildings", "organizations", "organization_phones"):
+        await conn.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT max(id) FROM {table}))"
+        ))
+    return {
+        "activities": len(activities),
+        "activity_depth": depth,
+        "buildings": buildings,
+        "clusters": clusters,
+        "organizations": organizations,
+        "phones": organizations * phones_per_organization,
+    }
+
+
+async def sample_arguments(db) -> dict:
+    # реальные значения из БД: самое населённое здание, самый частый вид деятельности
+    # и его корень, организация из этого здания и координаты здания
+    building_id = (await db.execute(text(
+        "SELECT building_id FROM organizations GROUP BY building_id ORDER BY count(*) DESC LIMIT 1"
+    ))).scalar()
+    activity_id = (await db.execute(text(
+        "SELECT activity_id FROM organization_activities GROUP BY activity_id ORDER BY count(*) DESC LIMIT 1"
+    ))).scalar()
+    root_id = (await db.execute(text(
+        "SELECT ancestor_id FROM activity_closure WHERE descendant_id = :activity_id ORDER BY depth DESC LIMIT 1"
+    ), {"activity_id": activity_id})).scalar()
+    org_id, name, lat, lon = (await db.execute(text("""
+        SELECT o.id, o.name, b.latitude, b.longitude
+        FROM organizations o JOIN buildings b ON b.id = o.building_id
+        WHERE o.building_id = :building_id
+        ORDER BY o.id LIMIT 1
+    """), {"building_id": building_id})).one()
+    return {
+        "building_id": building_id,
+        "activity_id": activity_id,
+        "root_id": root_id,
+        "org_id": org_id,
+        "name": name.split()[-2],
+        "lat": lat,
+        "lon": lon,
+    }
+
+
+async def run(args):
+    organizations = args.organizations or SCALES[args.scale]
+    async with engine.begin() as conn:
+        counts = await generate(
+            conn,
+            organizations=organizations,
+            buildings=args.buildings or max(1, organizations // 5),
+            roots=args.activity_roots,
+            branching=args.activity_branching,
+            depth=args.activity_depth,
+            clusters=args.clusters,
+            seed=args.seed,
+        )
+        await conn.execute(text("ANALYZE"))
+    await engine.dispose()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", choices=SCALES, default="medium")
+    parser.add_argument("--organizations", type=int, default=None, help="вместо --scale")
+    parser.add_argument("--buildings", type=int, default=None, help="по умолчанию — организаций / 5")
+    parser.add_argument("--activity-roots", type=int, default=8)
+    parser.add_argument("--activity-branching", type=int, default=5)
+    parser.add_argument("--activity-depth", type=int, default=3)
+    parser.add_argument("--clusters", type=int, default=12)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+import random
+
+import pytest
+
+from app.indexes.activity_orgs import ActivityOrgIndex, page_ids
+from app.indexes.activity_tree import activity_tree
+
+
+# 1 ─┬─ 2 ─┬─ 4
+#    │     └─ 5
+#    └─ 3 ─── 6 ─── 7
+# 8 (отдельный корень)
+TREE = [(1, "Еда", None), (2, "Мясо", 1), (3, "Молоко", 1), (4, "Говядина", 2),
+        (5, "Птица", 2), (6, "Сыр", 3), (7, "Твёрдый", 6), (8, "Автомобили", None)]
+
+
+@pytest.fixture(autouse=True)
+def tree():
+    activity_tree.loaded = False
+    activity_tree.build(TREE)
+    yield activity_tree
+    activity_tree.loaded = False
+
+
+def snapshot(index: ActivityOrgIndex) -> dict:
+    activity_ids = [activity_id for activity_id, _, _ in TREE]
+    return {
+        "direct": {activity_id: list(index.direct(activity_id)) for activity_id in activity_ids},
+        "subtree": {activity_id: list(index.subtree(activity_id)) for activity_id in activity_ids},
+    }
+
+
+def rebuilt(links: dict) -> ActivityOrgIndex:
+    index = ActivityOrgIndex()
+    index.build((org_id, activity_id) for org_id, activity_ids in links.items() for activity_id in activity_ids)
+    return index
+
+
+def test_build_unions_subtrees():
+    index = rebuilt({10: {4}, 11: {5, 7}, 12: {8}})
+    assert list(index.subtree(2)) == [10, 11]
+    assert list(index.subtree(1)) == [10, 11]
+    assert list(index.subtree(3)) == [11]
+    assert list(index.direct(1)) == []
+    assert index.any_of([4, 8]) == [10, 12]
+    assert index.all_of([2, 3]) == [11]
+
+
+def test_update_matches_full_rebuild():
+    rng = random.Random(7)
+    activity_ids = [activity_id for activity_id, _, _ in TREE]
+    links = {org_id: set(rng.sample(activity_ids, rng.randint(1, 3))) for org_id in range(100, 140)}
+    index = rebuilt(links)
+    for _ in range(200):
+        org_id = rng.randrange(100, 150)
+        # пустой набор — организация удалена или у неё не осталось видов деятельности
+        links[org_id] = set(rng.sample(activity_ids, rng.randint(0, 3)))
+        index.update({org_id: frozenset(links[org_id])})
+        assert snapshot(index) == snapshot(rebuilt(links))
+
+
+def test_update_after_tree_change_rebuilds_subtrees(tree):
+    index = rebuilt({10: {7}})
+    # 6 переезжает под 2 вместе с поддеревом
+    tree.build([(activity_id, name, 2 if activity_id == 6 else parent_id) for activity_id, name, parent_id in TREE])
+    index.update({11: frozenset({5})})
+    assert list(index.subtree(2)) == [10, 11]
+    assert list(index.subtree(3)) == []
+
+
+def test_sync_tree_only_after_change(tree):
+    index = rebuilt({10: {7}})
+    version = tree.version
+    tree.build(TREE)
+    assert tree.version == version
+    tree.build([(activity_id, name, 8 if activity_id == 3 else parent_id) for activity_id, name, parent_id in TREE])
+    assert tree.version == version + 1
+    index.sync_tree()
+    assert list(index.subtree(8)) == [10]
+    assert list(index.subtree(1)) == []
+
+
+def test_page_ids():
+    org_ids = [1, 3, 5, 7, 9]
+    assert page_ids(org_ids, 2, None) == ([1, 3], [3])
+    assert page_ids(org_ids, 2, [3]) == ([5, 7], [7])
+    assert page_ids(org_ids, 2, [7]) == ([9], None)
+    assert page_ids(org_ids, 2, [9]) == ([], None)
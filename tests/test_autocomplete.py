@@ -0,0 +1,72 @@
+import asyncio
+import random
+
+from app.indexes.autocomplete import MAX_KEY_LENGTH, REBUILD_BATCH_SIZE, AutocompleteIndex
+
+
+ITEMS = [
+    ("organization", 1, "ООО Рога и Копыта"),
+    ("organization", 2, "Зелёный Лес"),
+    ("organization", 3, "Молочный Рай"),
+    ("activity", 1, "Молочная продукция"),
+    ("activity", 2, "Мясная продукция"),
+]
+
+
+def built(items) -> AutocompleteIndex:
+    index = AutocompleteIndex()
+    index.build(items)
+    return index
+
+
+def test_suggest_matches_word_starts():
+    index = built(ITEMS)
+    assert index.suggest("мол", 10) == [("activity", 1, "Молочная продукция"), ("organization", 3, "Молочный Рай")]
+    assert index.suggest("  КОП ", 10) == [("organization", 1, "ООО Рога и Копыта")]
+    # начало слова — но не середина
+    assert index.suggest("пыта", 10) == []
+    assert index.suggest("", 10) == []
+
+
+def test_suggest_deduplicates_and_limits():
+    index = built(ITEMS)
+    # «продукция» — начало слова у двух видов деятельности; у каждого по одному совпадению
+    assert len(index.suggest("продук", 10)) == 2
+    assert len(index.suggest("м", 2)) == 2
+
+
+def test_long_prefix_is_checked_against_full_name():
+    base = "а" * MAX_KEY_LENGTH
+    index = built([("organization", 1, base + " один"), ("organization", 2, base + " два")])
+    assert index.suggest(base + " д", 10) == [("organization", 2, base + " два")]
+
+
+def test_update_matches_full_rebuild():
+    rng = random.Random(3)
+    words = ["молоко", "мясо", "сыр", "рога", "копыта", "лес", "рай", "молочный"]
+    names = {(kind, item_id): name for kind, item_id, name in ITEMS}
+    index = built(ITEMS)
+    for _ in range(200):
+        key = (rng.choice(["organization", "activity"]), rng.randint(1, 6))
+        # None — запись удалена
+        name = " ".join(rng.sample(words, rng.randint(1, 3))).capitalize() if rng.random() < 0.8 else None
+        if name is None:
+            names.pop(key, None)
+        else:
+            names[key] = name
+        index.update(*key, name)
+        expected = built((kind, item_id, name) for (kind, item_id), name in names.items())
+        for prefix in ["м", "мо", "сыр", "ко", "р", "лес ", "молочный р"]:
+            assert sorted(index.suggest(prefix, 100)) == sorted(expected.suggest(prefix, 100))
+
+
+def test_large_batch_is_rebuilt():
+    index = built(ITEMS)
+    changes = {("organization", item_id): f"Новая точка {item_id}" for item_id in range(10, 10 + REBUILD_BATCH_SIZE)}
+    changes[("organization", 2)] = None
+    changes[("activity", 1)] = "Молочные продукты"
+    asyncio.run(index.apply(changes))
+    assert len(index.suggest("нов", REBUILD_BATCH_SIZE + 10)) == REBUILD_BATCH_SIZE
+    assert index.suggest("зел", 10) == []
+    assert index.suggest("молочные", 10) == [("activity", 1, "Молочные продукты")]
+    assert index.suggest("рога", 10) == [("organization", 1, "ООО Рога и Копыта")]
@@ -0,0 +1,82 @@
+import random
+
+import pytest
+
+from app.db.crud.organization import MAX_COVER_CELLS, _bounding_box, geohash_cover, geohash_encode, haversine
+
+
+def inside(box, lat, lon) -> bool:
+    lat_min, lat_max, lon_min, lon_max = box
+    return lat_min <= lat <= lat_max and lon_min <= lon <= lon_max
+
+
+def test_haversine():
+    assert haversine(55.75, 37.62, 55.75, 37.62) == 0
+    # градус меридиана — около 111.2 км
+    assert haversine(0, 0, 1, 0) == pytest.approx(111.19, abs=0.01)
+    assert haversine(0, 179.5, 0, -179.5) == pytest.approx(111.19, abs=0.01)
+
+
+@pytest.mark.parametrize("lat, lon, radius_km", [
+    (55.75, 37.62, 0.5),
+    (55.75, 37.62, 50),
+    (-33.9, 151.2, 10),
+    (0, 0, 1000),
+    (80, 10, 500),
+])
+def test_box_contains_circle(lat, lon, radius_km):
+    box = _bounding_box(lat, lon, radius_km)
+    rng = random.Random(1)
+    for _ in range(500):
+        # точки на окружности и около неё
+        point_lat = lat + rng.uniform(-1, 1) * radius_km / 111
+        point_lon = lon + rng.uniform(-1, 1) * radius_km / 20
+        if not (-90 <= point_lat <= 90 and -180 <= point_lon <= 180):
+            continue
+        if haversine(lat, lon, point_lat, point_lon) <= radius_km:
+            assert inside(box, point_lat, point_lon)
+
+
+def test_box_near_pole_spans_all_longitudes():
+    lat_min, lat_max, lon_min, lon_max = _bounding_box(89.9, 30, 50)
+    assert lat_max == 90.0
+    assert (lon_min, lon_max) == (-180.0, 180.0)
+    assert inside((lat_min, lat_max, lon_min, lon_max), 89.9, -150)
+
+
+def test_box_crossing_antimeridian_spans_all_longitudes():
+    box = _bounding_box(10, 179.99, 5)
+    assert box[2:] == (-180.0, 180.0)
+    assert inside(box, 10, -179.99)
+
+
+def test_huge_radius():
+    assert _bounding_box(0, 0, 20000) == (-90.0, 90.0, -180.0, 180.0)
+
+
+def test_geohash_encode():
+    # пример из описания формата geohash
+    assert geohash_encode(57.64911, 10.40744, 11) == "u4pruydqqvj"
+    assert geohash_encode(-90, -180, 3) == "000"
+    assert geohash_encode(55.75, 37.62, 12).startswith(geohash_encode(55.75, 37.62, 5))
+
+
+@pytest.mark.parametrize("box", [
+    (55.74, 55.76, 37.60, 37.64),
+    (55.0, 56.0, 37.0, 39.0),
+    (-0.01, 0.01, -0.01, 0.01),
+    (10, 11, 179.5, 180),
+    (89.9, 90, -10, 10),
+])
+def test_geohash_cover_contains_box(box):
+    lat_min, lat_max, lon_min, lon_max = box
+    ranges = geohash_cover(*box)
+    assert 0 < len(ranges) <= MAX_COVER_CELLS
+    rng = random.Random(2)
+    for _ in range(500):
+        cell = geohash_encode(rng.uniform(lat_min, lat_max), rng.uniform(lon_min, lon_max), 12)
+        assert any(first <= cell < last for first, last in ranges)
+
+
+def test_geohash_cover_whole_world():
+    assert geohash_cover(-90, 90, -180, 180) == []
@@ -0,0 +1,102 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+
+from app import metrics as metrics_module
+from app.config import settings
+from app.metrics import Counter, Histogram, Metrics, MetricsMiddleware, RequestStats, _escape, _labels, server_timing
+
+
+@pytest.fixture
+def fresh_metrics(monkeypatch):
+    fresh = Metrics()
+    monkeypatch.setattr(metrics_module, "metrics", fresh)
+    return fresh
+
+
+def request(app, path: str, headers=None) -> httpx.Response:
+    async def main():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get(path, headers=headers)
+
+    return asyncio.run(main())
+
+
+def test_histogram_render_is_cumulative():
+    histogram = Histogram("latency", "Время", ("route",), (0.1, 1))
+    for value in (0.05, 0.1, 0.5, 3):
+        histogram.observe(("orgs",), value)
+    assert histogram.render() == [
+        "# HELP latency Время",
+        "# TYPE latency histogram",
+        'latency_bucket{route="orgs",le="0.1"} 2',
+        'latency_bucket{route="orgs",le="1"} 3',
+        'latency_bucket{route="orgs",le="+Inf"} 4',
+        'latency_sum{route="orgs"} 3.65',
+        'latency_count{route="orgs"} 4',
+    ]
+
+
+def test_counter_render_sorted_by_labels():
+    counter = Counter("requests", "Запросы", ("status",))
+    counter.inc(("500",))
+    counter.inc(("200",), 2)
+    assert counter.render()[2:] == ['requests{status="200"} 2', 'requests{status="500"} 1']
+
+
+def test_label_escaping():
+    assert _escape('a\\b"c\nd') == 'a\\\\b\\"c\\nd'
+    assert _labels(("route", "method"), ('say "hi"', "GET"), 'le="1"') == '{route="say \\"hi\\"",method="GET",le="1"}'
+
+
+def test_server_timing():
+    stats = RequestStats()
+    stats.db_seconds, stats.statements, stats.rows, stats.serialization_seconds = 0.0125, 2, 10, 0.001
+    assert server_timing(stats, 0.02) == 'db;dur=12.5;desc="2 statements, 10 rows", ser;dur=1.0, total;dur=20.0'
+
+
+def test_middleware_labels_by_route_name(fresh_metrics):
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get("/items/{item_id}", name="get_item")
+    async def get_item(item_id: int):
+        return PlainTextResponse("x" * item_id, status_code=201)
+
+    response = request(app, "/items/300")
+    assert response.status_code == 201
+    assert response.headers["server-timing"].startswith('db;dur=0.0;desc="0 statements, 0 rows"')
+    request(app, "/items/5")
+    request(app, "/missing")
+    assert fresh_metrics.requests.series == {("GET", "get_item", "201"): 2, ("GET", "unmatched", "404"): 1}
+    counts, total = fresh_metrics.response_size.series[("GET", "get_item")]
+    assert total == 305
+    # 5 байт — в первой корзине (256), 300 — во второй (1024)
+    assert counts[:2] == [1, 1]
+
+
+def test_middleware_without_server_timing(fresh_metrics):
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware, server_timing_header=False)
+
+    @app.get("/ping")
+    async def ping():
+        return {}
+
+    assert "server-timing" not in request(app, "/ping").headers
+
+
+@pytest.mark.skipif(not settings.metrics.enabled, reason="метрики выключены в настройках")
+def test_metrics_endpoint_does_not_need_api_key():
+    from app.main import app
+
+    response = request(app, "/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "# TYPE http_requests_total counter" in response.text
+    # а API без ключа закрыт
+    assert request(app, f"{settings.api.prefix}{settings.api.v1.prefix}/cache/stats").status_code == 401
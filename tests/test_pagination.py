@@ -0,0 +1,37 @@
+import base64
+
+import pytest
+from fastapi import HTTPException
+
+from app.api.v1.pagination import PageParams, decode_cursor, encode_cursor
+
+
+@pytest.mark.parametrize("key", [[1], [42, 7], [0.875, 123456789], [-3, 2 ** 40]])
+def test_cursor_round_trip(key):
+    cursor = encode_cursor(key)
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == key
+
+
+@pytest.mark.parametrize("cursor", [
+    "",
+    "не base64",
+    base64.urlsafe_b64encode(b"not json").decode(),
+    encode_cursor([]),
+    encode_cursor({"id": 1}),
+    encode_cursor(["1"]),
+    encode_cursor([True]),
+    encode_cursor([None]),
+])
+def test_invalid_cursor(cursor):
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(cursor)
+    assert error.value.status_code == 400
+
+
+def test_cursor_shape_must_match_endpoint():
+    page = PageParams(limit=10, cursor=encode_cursor([0.5, 10]))
+    assert page.key(2) == [0.5, 10]
+    with pytest.raises(HTTPException):
+        page.key(1)
+    assert PageParams(limit=10, cursor=None).key(1) is None
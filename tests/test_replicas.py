@@ -0,0 +1,108 @@
+import asyncio
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+
+from app.db.database import ReplicaSet, parse_lsn
+
+
+class Result:
+    def __init__(self, value):
+        self.value = value
+
+    def scalar(self):
+        return self.value
+
+
+class FakeEngine:
+    # то, что ReplicaSet берёт у движка: занятость пула, адрес и соединение для проверки
+    def __init__(self, host: str):
+        self.url = SimpleNamespace(host=host)
+        self.pool = SimpleNamespace(checkedout=lambda: self.checked_out)
+        self.checked_out = 0
+        self.up = True
+        self.lsn = "0/10"
+
+    @asynccontextmanager
+    async def connect(self):
+        if not self.up:
+            raise ConnectionRefusedError(self.url.host)
+        yield SimpleNamespace(execute=self.execute)
+
+    async def execute(self, statement):
+        return Result(self.lsn)
+
+
+def replica_set():
+    first, second = FakeEngine("first"), FakeEngine("second")
+    return ReplicaSet([first, second]), first, second
+
+
+def test_parse_lsn():
+    assert parse_lsn("0/10") == 16
+    assert parse_lsn("16/B374D848") == (0x16 << 32) + 0xB374D848
+
+
+def test_pick_least_busy_then_round_robin():
+    replicas, first, second = replica_set()
+    assert [replicas.pick() for _ in range(4)] == [first, second, first, second]
+    first.checked_out = 3
+    assert [replicas.pick() for _ in range(2)] == [second, second]
+    assert ReplicaSet([]).pick() is None
+
+
+def test_mark_down_excludes_replica():
+    replicas, first, second = replica_set()
+    replicas.mark_down(first)
+    assert [replicas.pick() for _ in range(3)] == [second] * 3
+    replicas.mark_down(second)
+    assert replicas.pick() is None
+
+
+def test_check_marks_down_and_recovers():
+    replicas, first, second = replica_set()
+    first.up = False
+    asyncio.run(replicas.check())
+    assert replicas.healthy == [False, True]
+    assert replicas.replayed == [0, 16]
+    first.up = True
+    asyncio.run(replicas.check())
+    assert replicas.healthy == [True, True]
+    assert replicas.replayed == [16, 16]
+
+
+def test_monitor_brings_replica_back():
+    replicas, first, second = replica_set()
+    replicas.mark_down(second)
+
+    async def main():
+        monitor = asyncio.create_task(replicas.monitor(0.01))
+        try:
+            for _ in range(100):
+                if replicas.healthy[1]:
+                    break
+                await asyncio.sleep(0.01)
+        finally:
+            monitor.cancel()
+
+    asyncio.run(main())
+    assert replicas.healthy == [True, True]
+
+
+def test_require_waits_for_replay():
+    replicas, first, second = replica_set()
+
+    async def main():
+        await replicas.check()
+        replicas.require(parse_lsn("0/20"))
+        assert not replicas.caught_up()
+        first.lsn = second.lsn = "0/20"
+        await asyncio.wait_for(replicas._catching_up, 1)
+        assert replicas.caught_up()
+
+    asyncio.run(main())
+    # неисправная реплика не задерживает кэширование
+    first.up = False
+    replicas.required_lsn = parse_lsn("0/30")
+    second.lsn = "0/30"
+    asyncio.run(replicas.check())
+    assert replicas.healthy[0] is False and replicas.caught_up()
@@ -0,0 +1,123 @@
+import gzip
+
+import pytest
+
+from app.api.v1 import cache
+from app.api.v1.cache import ResponseCache, _etag_matches
+
+
+HEADERS = {"content-type": "application/json"}
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache.time, "monotonic", clock)
+    return clock
+
+
+def test_hit_and_miss(clock):
+    responses = ResponseCache(max_bytes=1024, ttl_seconds=60, gzip_min_bytes=1024)
+    assert responses.get(("a",)) is None
+    entry = responses.put(("a",), b"[1]", HEADERS)
+    assert responses.get(("a",)) is entry
+    assert entry.etag.startswith('"') and entry.gzipped is None
+    assert responses.stats()["hits"] == 1 and responses.stats()["misses"] == 1
+
+
+def test_ttl(clock):
+    responses = ResponseCache(max_bytes=1024, ttl_seconds=60, gzip_min_bytes=1024)
+    responses.put(("a",), b"[1]", HEADERS)
+    clock.now += 59
+    assert responses.get(("a",)) is not None
+    clock.now += 1
+    assert responses.get(("a",)) is None
+    assert responses.stats()["expirations"] == 1
+    assert responses.stats()["bytes"] == 0
+
+
+def test_lru_eviction_by_size(clock):
+    responses = ResponseCache(max_bytes=30, ttl_seconds=60, gzip_min_bytes=1024)
+    responses.put(("a",), b"x" * 10, HEADERS)
+    responses.put(("b",), b"x" * 10, HEADERS)
+    # «a» использовали недавно — вытесняется «b»
+    responses.get(("a",))
+    responses.put(("c",), b"x" * 15, HEADERS)
+    assert responses.get(("b",)) is None
+    assert responses.get(("a",)) is not None and responses.get(("c",)) is not None
+    assert responses.stats()["evictions"] == 1
+    assert responses.stats()["bytes"] == 25
+
+
+def test_replace_and_oversized(clock):
+    responses = ResponseCache(max_bytes=30, ttl_seconds=60, gzip_min_bytes=1024)
+    responses.put(("a",), b"x" * 10, HEADERS)
+    responses.put(("a",), b"y" * 20, HEADERS)
+    assert responses.stats()["bytes"] == 20 and responses.stats()["entries"] == 1
+    # больше всего кэша — отдаётся, но не сохраняется
+    entry = responses.put(("b",), b"z" * 31, HEADERS)
+    assert entry.body == b"z" * 31
+    assert responses.get(("b",)) is None
+    assert responses.stats()["bytes"] == 20
+
+
+def test_gzip_counts_towards_size(clock):
+    body = b"[" + b"1," * 1000 + b"1]"
+    responses = ResponseCache(max_bytes=1 << 20, ttl_seconds=60, gzip_min_bytes=1024)
+    entry = responses.put(("a",), body, HEADERS)
+    assert gzip.decompress(entry.gzipped) == body
+    assert responses.stats()["bytes"] == len(body) + len(entry.gzipped)
+
+
+def test_clear(clock):
+    responses = ResponseCache(max_bytes=1024, ttl_seconds=60, gzip_min_bytes=1024)
+    responses.put(("a",), b"[1]", HEADERS)
+    responses.clear()
+    assert responses.get(("a",)) is None
+    assert responses.stats()["bytes"] == 0
+
+
+def test_etag_matches():
+    etag = '"abc"'
+    assert _etag_matches('"abc"', etag)
+    assert _etag_matches('W/"abc"', etag)
+    assert _etag_matches('"other", "abc-gzip"', etag)
+    assert _etag_matches("*", etag)
+    assert not _etag_matches('"abd"', etag)
+    assert not _etag_matches("", etag)
+
+
+def test_evict_by_tags(clock):
+    responses = ResponseCache(max_bytes=1 << 20, ttl_seconds=60, gzip_min_bytes=1024)
+    responses.put(("one",), b"[1]", HEADERS, {("organization", 1), ("building", 5)})
+    responses.put(("two",), b"[2]", HEADERS, {("organization", 2), ("building", 5)})
+    responses.put(("geo",), b"[3]", HEADERS, {("geo",)})
+    generation = responses.generation
+    assert responses.evict([("organization", 2)]) == 1
+    assert responses.generation == generation + 1
+    assert responses.get(("two",)) is None
+    assert responses.get(("one",)) is not None and responses.get(("geo",)) is not None
+    assert responses.evict([("building", 5), ("activity", 7)]) == 1
+    assert responses.get(("one",)) is None
+    assert responses.stats()["invalidations"] == 2
+
+
+def test_tags_follow_entry_removal(clock):
+    responses = ResponseCache(max_bytes=1 << 20, ttl_seconds=60, gzip_min_bytes=1024)
+    entry = responses.put(("a",), b"[1]", HEADERS, {("organization", 1)})
+    assert entry.size == 3 + cache.TAG_BYTES
+    # замена записи и истечение TTL не оставляют висящих меток
+    responses.put(("a",), b"[1]", HEADERS, {("organization", 2)})
+    assert responses.evict([("organization", 1)]) == 0
+    clock.now += 60
+    assert responses.get(("a",)) is None
+    assert responses.evict([("organization", 2)]) == 0
+    assert responses.stats()["bytes"] == 0
@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+
+from app.cache_tags import current_tags
+from app.db.crud.single_flight import single_flight
+
+
+class Body:
+    # считает запуски и держит их, пока тест не отпустит
+    def __init__(self):
+        self.calls = []
+        self.release = asyncio.Event()
+
+    async def __call__(self, db, value, error=None):
+        self.calls.append(value)
+        await self.release.wait()
+        if error is not None:
+            raise error
+        current_tags.get().add(("organization", str(value)))
+        return {"value": value}
+
+
+async def started(count: int = 1):
+    # даём задачам дойти до ожидания в теле
+    for _ in range(count + 2):
+        await asyncio.sleep(0)
+
+
+def test_identical_calls_share_one_run():
+    async def main():
+        body = Body()
+        fetch = single_flight(body)
+        calls = [asyncio.ensure_future(fetch(object(), 1)) for _ in range(5)]
+        await started()
+        body.release.set()
+        results = await asyncio.gather(*calls)
+        assert body.calls == [1]
+        assert all(result is results[0] for result in results)
+        # следующий вызов после завершения — новый запуск
+        assert await fetch(object(), 1) == {"value": 1}
+        assert body.calls == [1, 1]
+
+    asyncio.run(main())
+
+
+def test_different_args_run_separately():
+    async def main():
+        body = Body()
+        fetch = single_flight(body)
+        calls = [asyncio.ensure_future(fetch(object(), value)) for value in (1, 2, 1, [3])]
+        await started()
+        body.release.set()
+        assert await asyncio.gather(*calls) == [{"value": 1}, {"value": 2}, {"value": 1}, {"value": [3]}]
+        assert sorted(map(str, body.calls)) == ["1", "2", "[3]"]
+
+    asyncio.run(main())
+
+
+def test_error_reaches_every_waiter():
+    async def main():
+        body = Body()
+        fetch = single_flight(body)
+        error = ValueError("нет")
+        calls = [asyncio.ensure_future(fetch(object(), 1, error=error)) for _ in range(3)]
+        await started()
+        body.release.set()
+        results = await asyncio.gather(*calls, return_exceptions=True)
+        assert results == [error] * 3
+        assert len(body.calls) == 1
+
+    asyncio.run(main())
+
+
+def test_cancelled_leader_does_not_cancel_followers():
+    async def main():
+        body = Body()
+        fetch = single_flight(body)
+        leader = asyncio.ensure_future(fetch(object(), 1))
+        await started()
+        followers = [asyncio.ensure_future(fetch(object(), 1)) for _ in range(2)]
+        await started()
+        leader.cancel()
+        await started()
+        body.release.set()
+        assert await asyncio.gather(*followers) == [{"value": 1}, {"value": 1}]
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        assert body.calls == [1]
+
+    asyncio.run(main())
+
+
+def test_tags_reach_every_waiter():
+    async def main():
+        body = Body()
+        fetch = single_flight(body)
+
+        async def tagged():
+            tags = set()
+            current_tags.set(tags)
+            await fetch(object(), 7)
+            return tags
+
+        calls = [asyncio.ensure_future(tagged()) for _ in range(2)]
+        await started()
+        body.release.set()
+        assert await asyncio.gather(*calls) == [{("organization", "7")}] * 2
+
+    asyncio.run(main())
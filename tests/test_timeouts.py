@@ -0,0 +1,55 @@
+import asyncio
+
+import httpx
+from fastapi import Depends, FastAPI
+
+from app.config import settings
+from app.db.database import async_session_factory, engine, statement_timeout_ms, timeout_engine
+from app.dependencies.timeouts import route_statement_timeout
+
+
+ROUTE, TIMEOUT = next(iter(settings.db.route_statement_timeout_ms.items()))
+
+
+def timeouts_app(seen: list) -> FastAPI:
+    app = FastAPI(dependencies=[Depends(route_statement_timeout)])
+
+    async def handler():
+        seen.append(statement_timeout_ms.get())
+        return {}
+
+    app.add_api_route("/overridden", handler, name=ROUTE)
+    app.add_api_route("/default", handler, name="default_route")
+    return app
+
+
+def test_timeout_is_set_for_the_request_only():
+    seen = []
+    app = timeouts_app(seen)
+
+    async def main():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            await client.get("/overridden")
+            # после ответа значение сброшено и не достаётся следующему запросу
+            assert statement_timeout_ms.get() is None
+            await client.get("/default")
+
+    asyncio.run(main())
+    assert seen == [TIMEOUT, None]
+    assert statement_timeout_ms.get() is None
+
+
+def test_session_binds_to_engine_with_timeout():
+    session = async_session_factory()
+    assert session.sync_session.get_bind() is engine.sync_engine
+    token = statement_timeout_ms.set(TIMEOUT)
+    try:
+        bind = session.sync_session.get_bind()
+    finally:
+        statement_timeout_ms.reset(token)
+    variant = timeout_engine(engine, TIMEOUT)
+    assert bind is variant.sync_engine
+    assert variant.url == engine.url
+    # движок на каждый таймаут один
+    assert timeout_engine(engine, TIMEOUT) is variant